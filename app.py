@@ -1,33 +1,64 @@
+import sys
+
 from scripts.__arguments__ import ArgumentHandler
+from functions.__async_engine__ import LogFileSubscriber, get_output_bus
 from functions.__check_repository_connection__ import (
     check_linux_package_manager_connection,
 )
 from functions.__get_os_package_manager__ import (
+    apply_linux_plan,
     get_linux_package_manager,
+    plan_linux_packages,
 )
 from scripts.__terminal_UI__ import start_terminal_ui
-from functions.__get_packages_data__ import PackagesJSONHandler
+from functions.__get_packages_data__ import (
+    get_packages_catalog,
+    wait_for_background_refresh,
+)
+from functions.__download_cache__ import configure_download_cache
+from functions.__metadata_refresh__ import configure_metadata_refresh
+from functions.__pauses__ import configure_pauses
+from functions.__plan_file__ import read_plan_file, write_plan_file
+from functions.__privileged_helper__ import (
+    SERVE_ARGUMENT,
+    configure_privileged_helper,
+    serve,
+)
+from functions.__step_scheduler__ import configure_max_workers
+from functions.__transaction_journal__ import configure_journal
 
 
 class PackageManagerApp:
     def __init__(self):
         self.args = ArgumentHandler().get_args()
-        self.json_handler = PackagesJSONHandler()
-        self.packages_data = self.json_handler.load_json_data(refresh=self.args.refresh)
+        # Applying a plan does not need the package catalog.
+        self.catalog = None if self.args.apply else get_packages_catalog(
+            refresh=self.args.refresh,
+            background_refresh=self.args.background_refresh,
+            # Only the terminal UI redraws when the catalog changes.
+            live_update=not (self.args.packages or self.args.list or self.args.all),
+        )
+        configure_metadata_refresh(self.args.metadata_max_age)
+        configure_max_workers(self.args.jobs)
+        configure_download_cache(self.args.artifact_cache_size * 1024 * 1024)
+        configure_privileged_helper(self.args.privileged_helper)
+        configure_journal(not self.args.no_resume)
+        if self.args.no_pause:
+            configure_pauses(False)
+        if self.args.log_file:
+            get_output_bus().subscribe(LogFileSubscriber(self.args.log_file))
 
     def packages(self, linux_distro):
-        if linux_distro in self.packages_data:
-            package_list = self.packages_data[linux_distro]
-            relevant_packages = [package.get("name", "") for package in package_list]
-            return relevant_packages
-        else:
-            return []
+        return self.catalog.bundle_names(linux_distro)
 
     def run(self):
         """Run the main application logic."""
         try:
 
-            if self.args.packages or self.args.list or self.args.all:
+            if self.args.apply:
+                self.apply_plan()
+
+            elif self.args.packages or self.args.list or self.args.all:
                 relevant_packages = self.packages(self.args.distribution)
 
                 if self.args.list:
@@ -45,6 +76,10 @@ class PackageManagerApp:
                     print("Relevant packages for distribution:", relevant_packages)
                     print("Filtered packages to be processed:", valid_packages)
 
+                if self.args.plan:
+                    self.write_plan(valid_packages)
+                    return
+
                 if self.args.action == "install":
                     print("Checking package manager connection...")
                     stasus = check_linux_package_manager_connection(
@@ -57,33 +92,79 @@ class PackageManagerApp:
                         return
 
                 if valid_packages:
-                    for package in valid_packages:
-                        print("\n========================================")
-                        print(f"Processing package: {package}")
-                        print("========================================\n")
-
-                        get_linux_package_manager(
-                            linux_distribution=self.args.distribution,
-                            package_name=package,
-                            output=self.args.verbose,
-                            action=self.args.action,
-                            dry_run=self.args.dry_run,
-                        )
+                    print("\n========================================")
+                    print(f"Processing packages: {', '.join(valid_packages)}")
+                    print("========================================\n")
+
+                    get_linux_package_manager(
+                        linux_distribution=self.args.distribution,
+                        package_names=valid_packages,
+                        output=self.args.verbose,
+                        action=self.args.action,
+                        dry_run=self.args.dry_run,
+                        catalog=self.catalog,
+                    )
                 else:
                     print("No valid packages found for the specified distribution.")
 
             else:
-                start_terminal_ui()
+                start_terminal_ui(self.catalog)
 
         except KeyboardInterrupt:
             print("\nCtrl + C pressed. Exiting...")
+            print("Run the same command again to resume after the completed steps.")
             print("Goodbye 👋")
         except RuntimeError as re:
             print(f"Runtime error: {re}")
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
 
+    def write_plan(self, valid_packages):
+        """Resolve the selected packages into a plan file without running it."""
+        plan_file = plan_linux_packages(
+            linux_distribution=self.args.distribution,
+            package_names=valid_packages,
+            action=self.args.action,
+            catalog=self.catalog,
+        )
+        try:
+            write_plan_file(self.args.plan, plan_file)
+        except OSError as e:
+            print(f"Could not write the plan file: {e}")
+            return
+        print(
+            f"Wrote a plan of {len(plan_file['steps'])} steps and "
+            f"{len(plan_file['artifacts'])} artifacts to {self.args.plan}."
+        )
+
+    def apply_plan(self):
+        """Run the steps of a plan file made with --plan."""
+        try:
+            plan_file = read_plan_file(self.args.apply)
+        except (OSError, ValueError) as e:
+            print(f"Could not read the plan file: {e}")
+            return
+        if plan_file["action"] == "install":
+            print("Checking package manager connection...")
+            if not check_linux_package_manager_connection(self.args.distribution):
+                print("Failed to connect to package manager repository. Exiting...")
+                return
+        print("\n========================================")
+        print(f"Applying plan for: {', '.join(plan_file['bundles'])}")
+        print("========================================\n")
+        apply_linux_plan(
+            linux_distribution=self.args.distribution,
+            plan_file=plan_file,
+            output=self.args.verbose,
+            dry_run=self.args.dry_run,
+        )
+
 
 if __name__ == "__main__":
-    app = PackageManagerApp()
-    app.run()
+    if sys.argv[1:] == [SERVE_ARGUMENT]:
+        # Started by --privileged-helper as root, to run its sudo commands.
+        serve()
+    else:
+        app = PackageManagerApp()
+        app.run()
+        wait_for_background_refresh()
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import requests
+
+from functions.__download_cache__ import get_download_cache
+
+ARTIFACT_TYPES = {"local-package", "url-package"}
+
+
+def artifact_urls(plan, installed_packages, resolve_url=None):
+    """Return (url, sha256) of the not yet installed artifacts of a plan.
+
+    sha256 is the optional checksum pinned in packages.json, or None.
+    """
+    artifacts = []
+    for step in plan:
+        if step["kind"] != "entry":
+            continue
+        entry = step["entry"]
+        if entry.get("type") not in ARTIFACT_TYPES or not entry.get("install_value"):
+            continue
+        if installed_packages.missing(entry.get("check_value", "").split()):
+            url = entry["install_value"]
+            url = resolve_url(url) if resolve_url else url
+            if url not in [artifact[0] for artifact in artifacts]:
+                artifacts.append((url, entry.get("sha256")))
+    return artifacts
+
+
+def download_artifact(url, expected_sha256=None):
+    """Fetch url through the download cache and return its path, or None on failure."""
+    try:
+        return get_download_cache().fetch(url, expected_sha256)
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        print(f"Failed to download {url}: {e}")
+        return None
+
+
+class ArtifactPrefetcher:
+    """Download the artifacts of a plan in the background while other steps run."""
+
+    def __init__(self, max_workers=4):
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="vcandy-prefetch"
+        )
+        self.downloads = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, artifacts):
+        # Steps call fetch from several threads; every URL gets one download
+        # future that all of them wait on.
+        with self.lock:
+            for url, expected_sha256 in artifacts:
+                if url not in self.downloads:
+                    self.downloads[url] = self.pool.submit(
+                        download_artifact, url, expected_sha256
+                    )
+
+    def fetch(self, url, expected_sha256=None):
+        """Wait for url's download, starting it now if it was not prefetched."""
+        self.prefetch([(url, expected_sha256)])
+        with self.lock:
+            download = self.downloads[url]
+        return download.result()
+
+
+_prefetcher = None
+
+
+def get_artifact_prefetcher():
+    """Return the process-wide artifact prefetcher."""
+    global _prefetcher
+    if _prefetcher is None:
+        _prefetcher = ArtifactPrefetcher()
+    return _prefetcher
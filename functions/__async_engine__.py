@@ -0,0 +1,174 @@
+from asyncio.subprocess import PIPE
+import asyncio
+import shutil
+import sys
+import threading
+import time
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class LineSplitter:
+    """Turn chunks of output into complete lines, treating \\r as a line end too."""
+
+    def __init__(self, on_line):
+        self.on_line = on_line
+        self.pending = b""
+
+    def feed(self, chunk):
+        self.pending += chunk.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+        *lines, self.pending = self.pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                self.on_line(line.decode(errors="replace"))
+
+    def close(self):
+        if self.pending.strip():
+            self.on_line(self.pending.decode(errors="replace"))
+        self.pending = b""
+
+
+class OutputBus:
+    """Publish the output lines of every command to the subscribed sinks.
+
+    A subscriber has on_line(label, stream, line) and on_exit(label,
+    returncode) methods; stream is "stdout" or "stderr".
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.append(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def publish(self, label, stream, line):
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.on_line(label, stream, line)
+
+    def finish(self, label, returncode):
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.on_exit(label, returncode)
+
+
+class StatusLine:
+    """Show the latest output line of the running commands on one terminal line."""
+
+    def __init__(self, stream=sys.stderr):
+        self.stream = stream
+
+    def on_line(self, label, stream, line):
+        width = shutil.get_terminal_size().columns - 1
+        self.stream.write(f"\r\033[K{label}: {line.strip()}"[: width + 4])
+        self.stream.flush()
+
+    def on_exit(self, label, returncode):
+        self.stream.write("\r\033[K")
+        self.stream.flush()
+
+
+class LogFileSubscriber:
+    """Append every output line, with its command and stream, to a log file."""
+
+    def __init__(self, log_file):
+        self.file = open(log_file, "a")
+
+    def on_line(self, label, stream, line):
+        self.file.write(f"{time.strftime('%H:%M:%S')} [{label}] {stream}: {line}\n")
+        self.file.flush()
+
+    def on_exit(self, label, returncode):
+        self.file.write(f"{time.strftime('%H:%M:%S')} [{label}] exit {returncode}\n")
+        self.file.flush()
+
+
+def command_label(argv):
+    """Return a short name for a command, e.g. "apt" for sudo apt install ..."""
+    words = argv[1:] if argv[:1] == ["sudo"] else argv
+    return words[0].rsplit("/", 1)[-1] if words else ""
+
+
+class AsyncCommandEngine:
+    """Run commands with asyncio on one event loop in a background thread.
+
+    Steps running on different scheduler threads submit their commands to
+    the same loop, so their processes run side by side while each caller
+    waits only for its own. Output is read chunk by chunk as it arrives.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="vcandy-commands", daemon=True
+        )
+        self.thread.start()
+
+    async def read_stream(self, stream, on_chunk):
+        while True:
+            chunk = await stream.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            on_chunk(chunk)
+
+    async def execute_async(self, argv, input, cwd, on_stdout, on_stderr):
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=PIPE if input is not None else None,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=cwd,
+        )
+        if input is not None:
+            process.stdin.write(input)
+            await process.stdin.drain()
+            process.stdin.close()
+        await asyncio.gather(
+            self.read_stream(process.stdout, on_stdout),
+            self.read_stream(process.stderr, on_stderr),
+        )
+        return await process.wait()
+
+    def execute(self, argv, input=None, cwd=None, on_stdout=None, on_stderr=None):
+        """Run argv to completion and return its exit status.
+
+        on_stdout and on_stderr are called with each chunk of output on the
+        engine thread.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.execute_async(
+                argv,
+                input,
+                cwd,
+                on_stdout or (lambda chunk: None),
+                on_stderr or (lambda chunk: None),
+            ),
+            self.loop,
+        )
+        return future.result()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+_output_bus = OutputBus()
+
+
+def get_command_engine():
+    """Return the process-wide command engine, starting its loop on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncCommandEngine()
+        return _engine
+
+
+def get_output_bus():
+    """Return the process-wide bus command output is published on."""
+    return _output_bus
@@ -0,0 +1,290 @@
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from os import listdir, makedirs, path
+from pathlib import Path
+from shutil import rmtree
+from subprocess import PIPE
+import re
+
+from functions.__command_runner__ import get_command_runner, run
+from functions.__step_scheduler__ import get_max_workers
+
+AUR_DIR = Path(path.expanduser("~")) / ".cache" / "vcandy" / "aur"
+BUILD_DEPENDENCY_KEYS = {"makedepends", "checkdepends"}
+RUNTIME_DEPENDENCY_KEYS = {"depends"}
+
+
+def dependency_name(dependency):
+    """Return the package name of a dependency like "linux-headers>=6.9"."""
+    return re.split(r"[<>=]", dependency.strip(), maxsplit=1)[0]
+
+
+def read_srcinfo(repository_directory):
+    """Return the package names, build and runtime dependencies in a .SRCINFO file."""
+    package_names = []
+    build_dependencies = []
+    runtime_dependencies = []
+    try:
+        with open(path.join(repository_directory, ".SRCINFO"), "r") as file:
+            for line in file:
+                key, _, value = line.strip().partition(" = ")
+                # Architecture specific keys look like makedepends_x86_64.
+                key = key.split("_", 1)[0]
+                if key == "pkgname":
+                    package_names.append(value)
+                elif key in BUILD_DEPENDENCY_KEYS:
+                    build_dependencies.append(dependency_name(value))
+                elif key in RUNTIME_DEPENDENCY_KEYS:
+                    runtime_dependencies.append(dependency_name(value))
+    except OSError:
+        pass
+    return package_names, build_dependencies, runtime_dependencies
+
+
+def build_waves(build_dependencies, runtime_dependencies=None):
+    """Order packages into waves whose members can be built at the same time.
+
+    build_dependencies maps each package to the packages of the same batch
+    it needs installed to build. runtime_dependencies maps each package to
+    the packages of the batch it needs installed to be installed; those are
+    satisfied by the pacman -U that installs the whole wave, so a package
+    never goes in an earlier wave than its runtime dependencies.
+    """
+    runtime_dependencies = runtime_dependencies or {}
+    remaining = dict(build_dependencies)
+    waves = []
+    while remaining:
+        wave = {
+            package
+            for package, dependencies in remaining.items()
+            if not set(dependencies) & set(remaining)
+        }
+        # Hold back the packages whose runtime dependencies are not ready.
+        held_back = True
+        while held_back:
+            held_back = {
+                package
+                for package in wave
+                if set(runtime_dependencies.get(package, ())) & set(remaining) - wave
+            }
+            wave -= held_back
+        # A dependency cycle cannot be built in any order; try all at once.
+        wave = [package for package in remaining if package in wave] or list(
+            remaining
+        )
+        for package in wave:
+            del remaining[package]
+        waves.append(wave)
+    return waves
+
+
+class AURBuilder:
+    """Build AUR packages in parallel and install them with one pacman -U.
+
+    Every package is cloned (or pulled) into build/<name> under aur_dir.
+    Its built files are kept in packages/<name>/<commit>, keyed by the git
+    commit of its PKGBUILD, so a package is only rebuilt when it changed.
+    """
+
+    def __init__(self, aur_dir=AUR_DIR, max_workers=None):
+        self.build_root = Path(aur_dir) / "build"
+        self.packages_dir = Path(aur_dir) / "packages"
+        self.max_workers = max(1, max_workers or get_max_workers())
+
+    def repository_directory(self, name):
+        return str(self.build_root / name)
+
+    def fetch(self, name, hide):
+        """Clone or update the AUR repository of name and return its commit."""
+        repository_directory = self.repository_directory(name)
+        if path.isdir(path.join(repository_directory, ".git")):
+            result = run(
+                ["git", "-C", repository_directory, "pull", "--ff-only"],
+                stderr=hide,
+                stdout=hide,
+            )
+        else:
+            makedirs(self.build_root, exist_ok=True)
+            result = run(
+                [
+                    "git",
+                    "clone",
+                    f"https://aur.archlinux.org/{name}.git",
+                    repository_directory,
+                ],
+                stderr=hide,
+                stdout=hide,
+            )
+        if result.returncode != 0:
+            return None
+        commit = run(
+            ["git", "-C", repository_directory, "rev-parse", "HEAD"],
+            stdout=PIPE,
+            stderr=PIPE,
+            text=True,
+        )
+        return commit.stdout.strip() if commit.returncode == 0 else None
+
+    def cached_packages(self, name, commit):
+        return sorted(
+            file
+            for file in glob(str(self.packages_dir / name / commit / "*.pkg.tar*"))
+            if not file.endswith(".sig")
+        )
+
+    def build(self, name, commit, hide):
+        """Build name with makepkg into its cache directory and return the files."""
+        output_directory = self.packages_dir / name / commit
+        makedirs(output_directory, exist_ok=True)
+        # The dependencies from the repositories were installed beforehand;
+        # the ones built in the same batch come with the same pacman -U.
+        result = run(
+            [
+                "env",
+                f"PKGDEST={output_directory}",
+                "makepkg",
+                "--nodeps",
+                "--clean",
+                "--cleanbuild",
+                "--force",
+                "--noconfirm",
+            ],
+            cwd=self.repository_directory(name),
+            stderr=hide,
+            stdout=hide,
+        )
+        if result.returncode != 0:
+            rmtree(output_directory, ignore_errors=True)
+            return []
+        for old_commit in listdir(self.packages_dir / name):
+            if old_commit != commit:
+                rmtree(self.packages_dir / name / old_commit, ignore_errors=True)
+        return self.cached_packages(name, commit)
+
+    def install_build_dependencies(self, names, batch, hide):
+        """Install the repository packages names need to build, in one call.
+
+        Runtime dependencies are included, since build() and check() often
+        link against or run them. Dependencies built in the same batch, and
+        ones no repository provides, are left out.
+        """
+        dependencies = []
+        for name in names:
+            _, build, runtime = read_srcinfo(self.repository_directory(name))
+            for dependency in build + runtime:
+                if dependency not in batch and dependency not in dependencies:
+                    dependencies.append(dependency)
+        if not dependencies:
+            return
+        # pacman -T prints the dependencies that are not satisfied yet and
+        # then exits with 127.
+        unsatisfied = run(
+            ["pacman", "-T"] + dependencies,
+            stdout=PIPE,
+            stderr=PIPE,
+            text=True,
+            expected_returncodes=(0, 127),
+        ).stdout.split()
+        # pacman -Sp fails for the dependencies that are only in the AUR.
+        resolvable = [
+            dependency
+            for dependency in unsatisfied
+            if run(
+                ["pacman", "-Sp", "--print-format", "%n", dependency],
+                stdout=PIPE,
+                stderr=PIPE,
+                expected_returncodes=(0, 1),
+            ).returncode
+            == 0
+        ]
+        if resolvable:
+            run(
+                ["sudo", "pacman", "-S", "--needed", "--asdeps", "--noconfirm"]
+                + resolvable,
+                stderr=hide,
+                stdout=hide,
+            )
+
+    def install(self, names, hide):
+        """Fetch, build and install the AUR packages in names.
+
+        Returns the names that could not be fetched or built.
+        """
+        # The commands of the pool threads count for the step that runs us.
+        bind_scope = get_command_runner().bind_scope
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            commits = dict(
+                zip(
+                    names,
+                    pool.map(bind_scope(lambda name: self.fetch(name, hide)), names),
+                )
+            )
+        failed = [name for name in names if commits[name] is None]
+        fetched = [name for name in names if commits[name] is not None]
+
+        srcinfo = {
+            name: read_srcinfo(self.repository_directory(name)) for name in fetched
+        }
+        provided = {name: {name} | set(srcinfo[name][0]) for name in fetched}
+        batch = set().union(*provided.values())
+        build_dependencies, runtime_dependencies = (
+            {
+                name: [
+                    other
+                    for other in fetched
+                    if other != name and set(srcinfo[name][index]) & provided[other]
+                ]
+                for name in fetched
+            }
+            for index in (1, 2)
+        )
+
+        for wave in build_waves(build_dependencies, runtime_dependencies):
+            to_build = [
+                name for name in wave if not self.cached_packages(name, commits[name])
+            ]
+            for name in wave:
+                if name not in to_build:
+                    print(f"{name} is already built for commit {commits[name][:12]}.")
+            self.install_build_dependencies(to_build, batch, hide)
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                built = dict(
+                    zip(
+                        to_build,
+                        pool.map(
+                            bind_scope(
+                                lambda name: self.build(name, commits[name], hide)
+                            ),
+                            to_build,
+                        ),
+                    )
+                )
+            package_files = []
+            for name in wave:
+                files = built.get(name) or self.cached_packages(name, commits[name])
+                if files:
+                    package_files.extend(files)
+                else:
+                    failed.append(name)
+            if package_files:
+                result = run(
+                    ["sudo", "pacman", "-U", "--needed", "--noconfirm"] + package_files,
+                    stderr=hide,
+                    stdout=hide,
+                )
+                if result.returncode != 0:
+                    failed.extend(name for name in wave if name not in failed)
+
+        return failed
+
+
+_builder = None
+
+
+def get_aur_builder():
+    """Return the process-wide AUR builder."""
+    global _builder
+    if _builder is None:
+        _builder = AURBuilder()
+    return _builder
@@ -1,6 +1,8 @@
-from time import sleep
 from requests import get, ConnectionError, Timeout
 
+from functions.__pauses__ import pause
+
+
 def check_linux_package_manager_connection(distribution):
     package_manager_urls = {
         "ubuntu": "https://packages.ubuntu.com/",
@@ -23,5 +25,5 @@ def check_linux_package_manager_connection(distribution):
             return False
     else:
         print(f"Unsupported distribution: {distribution}")
-        sleep(5)
+        pause(5000)
         exit(1)
@@ -0,0 +1,271 @@
+from contextlib import contextmanager
+from subprocess import CalledProcessError, CompletedProcess, PIPE
+import re
+import shlex
+import sys
+import threading
+import time
+
+from functions.__async_engine__ import (
+    LineSplitter,
+    command_label,
+    get_command_engine,
+    get_output_bus,
+)
+from functions.__privileged_helper__ import get_privileged_helper
+
+STDERR_TAIL_BYTES = 4 * 1024
+
+# Script lines using any of these need a shell; all others are run directly.
+SHELL_SYNTAX = re.compile(r"[|&;<>()$`*?~\n]")
+
+
+def command_argv(command):
+    """Return the argv of a catalog script line.
+
+    Lines with pipes, redirections, substitutions or globs run through sh,
+    everything else is split and executed without a shell.
+    """
+    if SHELL_SYNTAX.search(command):
+        return ["sh", "-c", command]
+    return shlex.split(command)
+
+
+class StderrTail:
+    """Ring buffer keeping the last size bytes written to it."""
+
+    def __init__(self, size=STDERR_TAIL_BYTES):
+        self.size = size
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        del self.buffer[: -self.size]
+
+    def text(self):
+        return self.buffer.decode(errors="replace")
+
+
+class CommandRecord:
+    """Wall time, exit status and stderr tail of one finished command."""
+
+    def __init__(self, argv, returncode, duration, stderr_tail, failed=None):
+        self.argv = argv
+        self.returncode = returncode
+        self.duration = duration
+        self.stderr_tail = stderr_tail
+        self.failed = returncode != 0 if failed is None else failed
+
+    def __str__(self):
+        return f"{shlex.join(self.argv)} (exit {self.returncode}, {self.duration:.1f}s)"
+
+
+class CommandOutput:
+    """Route the output of one command to its caller, the terminal and the bus.
+
+    A stream set to None is shown on the terminal, PIPE is returned to the
+    caller and anything else (devnull) is hidden. Every line is published
+    on the output bus either way, and the end of stderr is kept in tail.
+    """
+
+    def __init__(self, label, stdout, stderr, tail):
+        self.label = label
+        self.tail = tail
+        self.stdout = bytearray() if stdout == PIPE else None
+        self.stderr = bytearray() if stderr == PIPE else None
+        self.show_stdout = sys.stdout.buffer if stdout is None else None
+        self.show_stderr = sys.stderr.buffer if stderr is None else None
+        bus = get_output_bus()
+        self.stdout_lines = LineSplitter(
+            lambda line: bus.publish(label, "stdout", line)
+        )
+        self.stderr_lines = LineSplitter(
+            lambda line: bus.publish(label, "stderr", line)
+        )
+
+    def write(self, chunk, collected, shown, lines):
+        if collected is not None:
+            collected.extend(chunk)
+        if shown is not None:
+            shown.write(chunk)
+            shown.flush()
+        lines.feed(chunk)
+
+    def write_stdout(self, chunk):
+        self.write(chunk, self.stdout, self.show_stdout, self.stdout_lines)
+
+    def write_stderr(self, chunk):
+        self.tail.write(chunk)
+        self.write(chunk, self.stderr, self.show_stderr, self.stderr_lines)
+
+    def close(self, returncode):
+        self.stdout_lines.close()
+        self.stderr_lines.close()
+        get_output_bus().finish(self.label, returncode)
+
+    def captured(self):
+        return (
+            bytes(self.stdout) if self.stdout is not None else None,
+            bytes(self.stderr) if self.stderr is not None else None,
+        )
+
+
+class CommandRunner:
+    """Run argv lists without a shell and keep a record of every command.
+
+    Output goes where the caller sends it, as with subprocess.run, and is
+    streamed to the output bus. The last stderr_tail_bytes of stderr are
+    kept for diagnostics even when it is hidden from the user. sudo commands
+    go to the privileged helper when it is enabled.
+
+    record_scope collects the records of the commands one step runs, so
+    that steps running at the same time can be told apart.
+    """
+
+    def __init__(self, stderr_tail_bytes=STDERR_TAIL_BYTES):
+        self.stderr_tail_bytes = stderr_tail_bytes
+        self.records = []
+        self.lock = threading.Lock()
+        self.scopes = threading.local()
+
+    @contextmanager
+    def record_scope(self):
+        """Collect the records of the commands the block runs on this thread.
+
+        Work handed to other threads is included when it is wrapped with
+        bind_scope. Records of a nested scope count for the outer one too.
+        """
+        outer = getattr(self.scopes, "records", None)
+        records = []
+        self.scopes.records = records
+        try:
+            yield records
+        finally:
+            self.scopes.records = outer
+            if outer is not None:
+                outer.extend(records)
+
+    def bind_scope(self, function):
+        """Wrap function to record its commands in the caller's record scope."""
+        records = getattr(self.scopes, "records", None)
+
+        def bound(*args, **kwargs):
+            outer = getattr(self.scopes, "records", None)
+            self.scopes.records = records
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.scopes.records = outer
+
+        return bound
+
+    def spawn(self, argv, input, cwd, output):
+        try:
+            return get_command_engine().execute(
+                argv, input, cwd, output.write_stdout, output.write_stderr
+            )
+        except OSError as e:
+            # Report a missing program like a shell would, instead of raising.
+            output.write_stderr(f"{e}\n".encode())
+            return 127
+
+    def run_privileged(self, helper, argv, input, cwd, output):
+        """Run argv in the privileged helper instead of a sudo process."""
+        return helper.execute(
+            argv, input, cwd, output.write_stdout, output.write_stderr
+        )
+
+    def run(
+        self,
+        argv,
+        stdout=None,
+        stderr=None,
+        input=None,
+        check=False,
+        cwd=None,
+        text=False,
+        capture_output=False,
+        expected_returncodes=(0,),
+    ):
+        """Run argv like subprocess.run and record it.
+
+        Exit codes in expected_returncodes are not counted as failures, e.g.
+        for queries that answer with their exit code. Returns a
+        CompletedProcess whose record attribute is the CommandRecord.
+        """
+        if capture_output:
+            stdout = stderr = PIPE
+        if isinstance(input, str):
+            input = input.encode()
+        output = CommandOutput(
+            command_label(argv), stdout, stderr, StderrTail(self.stderr_tail_bytes)
+        )
+
+        start = time.monotonic()
+        helper = get_privileged_helper() if argv[:1] == ["sudo"] else None
+        if helper:
+            returncode = self.run_privileged(helper, argv[1:], input, cwd, output)
+        else:
+            returncode = self.spawn(argv, input, cwd, output)
+        output.close(returncode)
+
+        record = CommandRecord(
+            list(argv),
+            returncode,
+            time.monotonic() - start,
+            output.tail.text(),
+            returncode not in expected_returncodes,
+        )
+        with self.lock:
+            self.records.append(record)
+            scope = getattr(self.scopes, "records", None)
+            if scope is not None:
+                scope.append(record)
+
+        stdout, stderr = output.captured()
+        if text:
+            stdout = stdout.decode(errors="replace") if stdout is not None else None
+            stderr = stderr.decode(errors="replace") if stderr is not None else None
+        if check and returncode != 0:
+            if stderr is None:
+                # Uncaptured stderr is reported from the tail, with the type
+                # subprocess would give: callers decode bytes.
+                stderr = record.stderr_tail if text else record.stderr_tail.encode()
+            raise CalledProcessError(returncode, argv, stdout, stderr)
+        result = CompletedProcess(argv, returncode, stdout, stderr)
+        result.record = record
+        return result
+
+    def failures(self):
+        with self.lock:
+            return [record for record in self.records if record.failed]
+
+    def report(self):
+        """Print how many commands ran and the stderr tail of those that failed."""
+        with self.lock:
+            records = list(self.records)
+        if not records:
+            return
+        total = sum(record.duration for record in records)
+        failures = self.failures()
+        print(f"Ran {len(records)} commands in {total:.1f}s, {len(failures)} failed.")
+        for record in failures:
+            print(f"Failed: {record}")
+            if record.stderr_tail.strip():
+                print(record.stderr_tail.rstrip())
+
+
+_command_runner = None
+
+
+def get_command_runner():
+    """Return the process-wide command runner."""
+    global _command_runner
+    if _command_runner is None:
+        _command_runner = CommandRunner()
+    return _command_runner
+
+
+def run(argv, **kwargs):
+    """Run argv through the process-wide command runner."""
+    return get_command_runner().run(argv, **kwargs)
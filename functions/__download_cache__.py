@@ -0,0 +1,218 @@
+from hashlib import sha256
+from os import link, path, remove, replace
+from pathlib import Path
+from shutil import copyfile, rmtree
+from urllib.parse import urlparse
+import json
+import shlex
+import tempfile
+import threading
+import time
+import requests
+
+from functions.__download_engine__ import download_resumable, file_sha256
+
+ARTIFACTS_DIR = Path(path.expanduser("~")) / ".cache" / "vcandy" / "artifacts"
+DEFAULT_SIZE_BUDGET = 5 * 1024 * 1024 * 1024
+
+
+def link_or_copy(source, destination):
+    """Hard-link source to destination, copying when linking is not possible."""
+    if path.exists(destination):
+        remove(destination)
+    try:
+        link(source, destination)
+    except OSError:
+        copyfile(source, destination)
+
+
+class DownloadCache:
+    """Content-addressed cache of downloaded artifacts.
+
+    Files are stored as objects/<sha256>/<filename> and indexed by URL
+    together with the ETag and size the server reported. A cached file is
+    reused while the server still reports the same ETag/size (or, when
+    offline or pinned, while its checksum matches) and is verified against
+    its SHA-256 before it is handed out. The least recently used files are
+    evicted once the cache grows beyond size_budget bytes.
+    """
+
+    def __init__(self, cache_dir=ARTIFACTS_DIR, size_budget=DEFAULT_SIZE_BUDGET):
+        self.cache_dir = Path(cache_dir)
+        self.objects_dir = self.cache_dir / "objects"
+        self.partial_dir = self.cache_dir / "partial"
+        self.index_file = self.cache_dir / "index.json"
+        self.size_budget = size_budget
+        self.lock = threading.Lock()
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.index = self.read_index()
+
+    def read_index(self):
+        try:
+            with open(self.index_file, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def write_index(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".index-")
+        with open(fd, "w") as file:
+            json.dump(self.index, file)
+        replace(temp_path, self.index_file)
+
+    def object_path(self, entry):
+        return self.objects_dir / entry["sha256"] / entry["filename"]
+
+    def remote_validators(self, url):
+        """Return the (etag, size) the server reports for url, or None offline."""
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=15)
+            if response.status_code != 200:
+                return None
+            size = response.headers.get("Content-Length")
+            return response.headers.get("ETag"), int(size) if size else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def is_current(self, url, entry):
+        """Return whether the server still reports the ETag/size of entry."""
+        validators = self.remote_validators(url)
+        if validators is None:
+            return True
+        etag, size = validators
+        if etag and etag != entry.get("etag"):
+            return False
+        return size is None or size == entry.get("size")
+
+    def cached_sha256(self, url):
+        """Return the checksum of url's cached copy while it is current, or None.
+
+        Unlike lookup, the cached file is not read and verified.
+        """
+        with self.lock:
+            entry = self.index.get(url)
+        if not entry or not self.object_path(entry).exists():
+            return None
+        return entry["sha256"] if self.is_current(url, entry) else None
+
+    def lookup(self, url, expected_sha256=None):
+        """Return the cached path of url if it is still current and intact."""
+        with self.lock:
+            entry = self.index.get(url)
+        if not entry or not self.object_path(entry).exists():
+            return None
+        if expected_sha256 and entry["sha256"] != expected_sha256.lower():
+            return None
+
+        if not expected_sha256 and not self.is_current(url, entry):
+            return None
+
+        object_path = self.object_path(entry)
+        if file_sha256(object_path) != entry["sha256"]:
+            print(f"Cached copy of {url} is corrupt. Downloading it again...")
+            rmtree(object_path.parent, ignore_errors=True)
+            return None
+        with self.lock:
+            entry["last_used"] = time.time()
+            self.write_index()
+        return str(object_path)
+
+    def download(self, url, expected_sha256=None, progress=None):
+        filename = path.basename(urlparse(url).path) or "artifact"
+        # The partial file is named after the URL so that an interrupted
+        # download is resumed by the next run.
+        part_path = self.partial_dir / f"{sha256(url.encode()).hexdigest()}.part"
+        checksum, etag, size = download_resumable(
+            url, str(part_path), expected_sha256, progress
+        )
+
+        entry = {
+            "sha256": checksum,
+            "filename": filename,
+            "etag": etag,
+            "size": size,
+            "last_used": time.time(),
+        }
+        object_path = self.object_path(entry)
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        replace(part_path, object_path)
+        with self.lock:
+            self.index[url] = entry
+            self.evict(keep=url)
+            self.write_index()
+        return str(object_path)
+
+    def evict(self, keep=None):
+        """Drop least recently used files until the cache fits its size budget."""
+        objects = {}
+        for url, entry in self.index.items():
+            objects.setdefault(entry["sha256"], []).append(url)
+        total = sum(self.index[urls[0]]["size"] for urls in objects.values())
+
+        by_age = sorted(
+            objects.items(),
+            key=lambda item: max(self.index[url]["last_used"] for url in item[1]),
+        )
+        for checksum, urls in by_age:
+            if total <= self.size_budget:
+                break
+            if keep in urls:
+                continue
+            total -= self.index[urls[0]]["size"]
+            rmtree(self.objects_dir / checksum, ignore_errors=True)
+            for url in urls:
+                del self.index[url]
+
+    def fetch(self, url, expected_sha256=None, progress=None):
+        """Return a verified local path for url, downloading it if needed."""
+        cached = self.lookup(url, expected_sha256)
+        if cached:
+            return cached
+        return self.download(url, expected_sha256, progress)
+
+    def fetch_to(self, url, destination, expected_sha256=None, progress=None):
+        """Fetch url through the cache and place it at destination."""
+        link_or_copy(self.fetch(url, expected_sha256, progress), destination)
+        return destination
+
+
+_download_cache = None
+_size_budget = DEFAULT_SIZE_BUDGET
+
+
+def configure_download_cache(size_budget):
+    """Set the artifact cache size budget in bytes."""
+    global _size_budget
+    _size_budget = size_budget
+    if _download_cache is not None:
+        _download_cache.size_budget = size_budget
+
+
+def get_download_cache():
+    """Return the process-wide artifact download cache."""
+    global _download_cache
+    if _download_cache is None:
+        _download_cache = DownloadCache(size_budget=_size_budget)
+    return _download_cache
+
+
+def fetch_script_download(command, cwd=None):
+    """Serve a plain "wget <url>" install_script line from the download cache.
+
+    Returns False for any other command so that the caller runs it as is.
+    """
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return False
+    if len(argv) != 2 or argv[0] != "wget" or argv[1].startswith("-"):
+        return False
+    url = argv[1]
+    destination = path.join(cwd or ".", path.basename(urlparse(url).path))
+    try:
+        get_download_cache().fetch_to(url, destination)
+    except (requests.exceptions.RequestException, OSError, ValueError) as e:
+        print(f"Failed to download {url}: {e}")
+        return False
+    return True
@@ -0,0 +1,156 @@
+from hashlib import sha256
+from os import path, remove
+import json
+import re
+import time
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+# Small network reads, so little is lost when a connection drops mid-chunk.
+STREAM_CHUNK_SIZE = 64 * 1024
+RETRYABLE_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+class IncompleteDownload(IOError):
+    """The connection closed before the whole file was received."""
+
+
+def file_sha256(file_path, chunk_size=CHUNK_SIZE):
+    digest = sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_part_metadata(part_path):
+    try:
+        with open(f"{part_path}.meta", "r") as file:
+            return json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def write_part_metadata(part_path, response):
+    metadata = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    with open(f"{part_path}.meta", "w") as file:
+        json.dump(metadata, file)
+    return metadata
+
+
+def discard_part(part_path):
+    for file_path in (part_path, f"{part_path}.meta"):
+        if path.exists(file_path):
+            remove(file_path)
+
+
+def total_size(response, offset):
+    """Return the full size of the file being sent, or None if unknown."""
+    content_range = response.headers.get("Content-Range", "")
+    match = re.match(r"bytes (?:\d+-\d+|\*)/(\d+)", content_range)
+    if match:
+        return int(match.group(1))
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length else None
+
+
+def progress_printer(label, step=10):
+    """Return a progress callback printing every step percent of label's download."""
+    reported = [-step]
+
+    def progress(downloaded, total):
+        if not total:
+            return
+        percent = downloaded * 100 // total
+        if percent >= reported[0] + step or downloaded == total:
+            reported[0] = percent - percent % step
+            megabytes = f"{downloaded // 1024 // 1024}/{total // 1024 // 1024} MB"
+            print(f"{label}: {percent}% ({megabytes})")
+
+    return progress
+
+
+def resume_download(url, part_path, progress=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Fetch the rest of url into part_path and return (etag, size).
+
+    A partial file left by an earlier attempt is continued with a Range
+    request. If-Range makes the server send the whole file again when it
+    changed since, in which case the partial file is started over.
+    """
+    offset = path.getsize(part_path) if path.exists(part_path) else 0
+    metadata = read_part_metadata(part_path) if offset else {}
+    validator = metadata.get("etag") or metadata.get("last_modified")
+    headers = {}
+    if offset and validator:
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+    else:
+        offset = 0
+
+    with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 416:
+            # Nothing left to send: the partial file is already complete,
+            # unless the file on the server shrank.
+            if total_size(response, 0) == offset:
+                return metadata.get("etag"), offset
+            discard_part(part_path)
+            raise IncompleteDownload(f"{url} changed while it was downloaded.")
+        response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0
+            metadata = write_part_metadata(part_path, response)
+        total = total_size(response, offset)
+
+        with open(part_path, "ab" if offset else "wb") as file:
+            downloaded = offset
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                file.write(chunk)
+                downloaded += len(chunk)
+                if progress:
+                    progress(downloaded, total)
+
+    if total is not None and downloaded < total:
+        raise IncompleteDownload(f"Received {downloaded} of {total} bytes of {url}.")
+    return metadata.get("etag"), downloaded
+
+
+def download_resumable(
+    url,
+    part_path,
+    expected_sha256=None,
+    progress=None,
+    max_retries=5,
+    retry_delay=1,
+):
+    """Download url into part_path, resuming after dropped connections.
+
+    Returns (sha256, etag, size) of the complete file. The partial file is
+    kept when every retry fails, so the next run continues where this one
+    stopped, and removed when the finished file does not match
+    expected_sha256.
+    """
+    for attempt in range(max_retries):
+        try:
+            etag, size = resume_download(url, part_path, progress)
+            break
+        except (IncompleteDownload, *RETRYABLE_ERRORS) as e:
+            if attempt == max_retries - 1:
+                raise
+            print(f"Download of {url} interrupted ({e}). Resuming...")
+            time.sleep(retry_delay)
+
+    checksum = file_sha256(part_path)
+    if expected_sha256 and checksum != expected_sha256.lower():
+        discard_part(part_path)
+        raise ValueError(
+            f"Checksum mismatch for {url}: expected {expected_sha256}, got {checksum}"
+        )
+    if path.exists(f"{part_path}.meta"):
+        remove(f"{part_path}.meta")
+    return checksum, etag, size
@@ -0,0 +1,67 @@
+from os import path
+
+DPKG_STATUS_FILE = "/var/lib/dpkg/status"
+
+_status_cache = {}
+
+
+def parse_dpkg_status(lines):
+    """Yield (package, architecture, status, version) for each stanza of a dpkg status file."""
+    package = architecture = status = version = None
+    for line in lines:
+        if not line.strip():
+            if package:
+                yield package, architecture, status, version
+            package = architecture = status = version = None
+            continue
+        if line[0] in " \t":
+            # Continuation of a multi-line field such as Description or Conffiles.
+            continue
+        field, _, value = line.partition(":")
+        if field == "Package":
+            package = value.strip()
+        elif field == "Architecture":
+            architecture = value.strip()
+        elif field == "Status":
+            # "install ok installed" -> "installed"
+            status = value.split()[-1] if value.split() else None
+        elif field == "Version":
+            version = value.strip()
+    if package:
+        yield package, architecture, status, version
+
+
+def read_dpkg_status(status_file=DPKG_STATUS_FILE):
+    """Return {package: (status, version)} for a dpkg status file.
+
+    The file is parsed in a single streaming pass and the index is cached
+    until the file's mtime changes. Multi-arch packages are also indexed as
+    "package:architecture"; the bare name prefers an installed instance.
+    """
+    modified = path.getmtime(status_file)
+    cached = _status_cache.get(status_file)
+    if cached and cached[0] == modified:
+        return cached[1]
+
+    index = {}
+    with open(status_file, "r", encoding="utf-8", errors="replace") as file:
+        for package, architecture, status, version in parse_dpkg_status(file):
+            entry = (status, version)
+            if architecture:
+                index[f"{package}:{architecture}"] = entry
+            if package not in index or status == "installed":
+                index[package] = entry
+
+    _status_cache[status_file] = (modified, index)
+    return index
+
+
+def installed_dpkg_packages(status_file=DPKG_STATUS_FILE):
+    """Return the set of installed package names, or None without a dpkg database."""
+    if not path.exists(status_file):
+        return None
+    return {
+        package
+        for package, (status, _) in read_dpkg_status(status_file).items()
+        if status == "installed"
+    }
@@ -0,0 +1,105 @@
+from subprocess import PIPE
+
+from functions.__command_runner__ import run
+
+
+class FlatpakState:
+    """Installed flatpak applications and configured remotes.
+
+    Both are queried once and reused until invalidated, instead of listing
+    every installed ref again for each flatpak entry.
+    """
+
+    def __init__(self):
+        self.apps = None
+        self.remote_names = None
+
+    def query_column(self, argv):
+        result = run(argv, stdout=PIPE, stderr=PIPE, text=True)
+        if result.returncode != 0:
+            return set()
+        return {line.strip() for line in result.stdout.splitlines() if line.strip()}
+
+    def installed_apps(self):
+        if self.apps is None:
+            self.apps = self.query_column(
+                ["flatpak", "list", "--app", "--columns=application"]
+            )
+        return self.apps
+
+    def remotes(self):
+        if self.remote_names is None:
+            self.remote_names = self.query_column(
+                ["flatpak", "remotes", "--columns=name"]
+            )
+        return self.remote_names
+
+    def missing(self, names):
+        """Return the application IDs that are not installed, keeping their order."""
+        installed = self.installed_apps()
+        return [name for name in names if name not in installed]
+
+    def invalidate(self):
+        """Forget the queried state after refs or remotes were changed."""
+        self.apps = None
+        self.remote_names = None
+
+
+_state = FlatpakState()
+
+
+def get_flatpak_state():
+    """Return the process-wide flatpak state."""
+    return _state
+
+
+def add_flathub_remote(url, hide):
+    """Add the flathub remote from url, unless it is already configured."""
+    if "flathub" in _state.remotes():
+        print("Flathub remote already added. Skipping...")
+        return
+    run(
+        ["sudo", "flatpak", "remote-add", "--if-not-exists", "flathub", url],
+        stderr=hide,
+        stdout=hide,
+    )
+    _state.invalidate()
+
+
+def flatpak_transaction(packages, action, dry_run, hide):
+    """Install or remove several "package-flatpak" entries with one flatpak call.
+
+    Returns the entries that were to be changed when the call failed, so
+    that the caller can retry them one by one.
+    """
+    pending = []
+    for package in packages:
+        missing = _state.missing(package.get("check_value", "").split())
+        if action == "install":
+            if missing:
+                print(f"{package['name']} not installed. Installing...")
+                pending.append(package)
+            else:
+                print(f"{package['name']} was installed. Skipping...")
+        elif action == "remove":
+            if missing:
+                print(f"{package['name']} not installed. Skipping...")
+            else:
+                print(f"{package['name']} removing...")
+                pending.append(package)
+
+    value_key = "install_value" if action == "install" else "remove_value"
+    refs = [ref for package in pending for ref in package.get(value_key, "").split()]
+    if dry_run or not refs:
+        return []
+
+    flatpak_action = "install" if action == "install" else "remove"
+    result = run(
+        ["sudo", "flatpak", flatpak_action, "-y"] + refs,
+        stderr=hide,
+        stdout=hide,
+    )
+    _state.invalidate()
+    if result.returncode != 0 and len(pending) > 1:
+        return pending
+    return []
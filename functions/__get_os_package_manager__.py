@@ -1,8 +1,11 @@
-from linux_distros.__arch__ import arch_package_manager
-from linux_distros.__debian__ import debian_package_manager
-from linux_distros.__fedora__ import fedora_package_manager
-from linux_distros.__ubuntu__ import ubuntu_package_manager
-from functions.__get_packages_data__ import PackagesJSONHandler
+from linux_distros.__arch__ import arch_package_manager, arch_plan
+from linux_distros.__debian__ import debian_package_manager, debian_plan
+from linux_distros.__fedora__ import fedora_package_manager, fedora_plan
+from linux_distros.__ubuntu__ import ubuntu_package_manager, ubuntu_plan
+from functions.__async_engine__ import StatusLine, get_output_bus
+from functions.__get_packages_data__ import get_packages_catalog
+from functions.__plan_file__ import new_plan_file
+import sys
 
 
 
@@ -34,19 +37,68 @@ def identify_distribution():
         return 'Not running on Linux'
 
 
-def get_linux_package_manager(linux_distribution, package_name, output, action, dry_run=False):
-    handler = PackagesJSONHandler()
-    packages_data = handler.load_json_data()
+def selected_bundles(catalog, linux_distribution, package_names):
+    bundles = {}
+    for package_name in package_names:
+        values = catalog.get_values(linux_distribution, package_name)
+        if values:
+            bundles[package_name] = values
+    return bundles
+
+
+def run_package_manager(package_manager_func, bundles, output, action, dry_run, plan_file=None):
+    # With hidden output, show the latest line of the running commands so
+    # that progress is still visible.
+    status_line = StatusLine() if not output and sys.stderr.isatty() else None
+    if status_line:
+        get_output_bus().subscribe(status_line)
+    try:
+        package_manager_func(bundles, output, action, dry_run, plan_file)
+    finally:
+        if status_line:
+            get_output_bus().unsubscribe(status_line)
+
+
+def get_linux_package_manager(linux_distribution, package_names, output, action, dry_run=False, catalog=None):
+    catalog = catalog or get_packages_catalog()
 
     package_manager_func = globals().get(f"{linux_distribution.lower()}_package_manager")
     if package_manager_func:
-        package_data_ref = packages_data.get(linux_distribution, [])
-        for data in package_data_ref:
-            name = data.get("name", "")
-            if package_name in name or package_name in name.lower():
-                values = data.get("values", [])
-                package_manager_func(values, output, action, dry_run)
-                return
+        bundles = selected_bundles(catalog, linux_distribution, package_names)
+        if bundles:
+            run_package_manager(package_manager_func, bundles, output, action, dry_run)
     else:
         print(f"No installation instructions found for {linux_distribution}.")
         exit(1)
+
+
+def plan_linux_packages(linux_distribution, package_names, action, catalog=None):
+    """Resolve the selected bundles against this system into a plan file."""
+    catalog = catalog or get_packages_catalog()
+
+    plan_func = globals().get(f"{linux_distribution.lower()}_plan")
+    if plan_func:
+        bundles = selected_bundles(catalog, linux_distribution, package_names)
+        steps, artifacts = plan_func(bundles, action)
+        return new_plan_file(linux_distribution, action, bundles, steps, artifacts)
+    else:
+        print(f"No installation instructions found for {linux_distribution}.")
+        exit(1)
+
+
+def apply_linux_plan(linux_distribution, plan_file, output, dry_run=False):
+    """Execute the steps of a plan file as they were planned."""
+    if plan_file["distribution"] != linux_distribution:
+        print(
+            f"The plan was made for {plan_file['distribution']}, "
+            f"but this is {linux_distribution}."
+        )
+        exit(1)
+
+    package_manager_func = globals().get(f"{linux_distribution.lower()}_package_manager")
+    if plan_file["steps"]:
+        run_package_manager(
+            package_manager_func, {}, output, plan_file["action"], dry_run, plan_file
+        )
+    else:
+        print("The plan has no steps. Nothing to do.")
@@ -3,45 +3,115 @@ import json
 import os
 from pathlib import Path
 import requests
+import tempfile
+import threading
 import time
 
 class PackagesJSONHandler:
     def __init__(self, json_file_url=None):
         self.json_file_url = json_file_url or "https://raw.githubusercontent.com/Hakanbaban53/Container-and-Virtualization-Installer/main/packages/packages.json"
         self.json_file_path = self.get_cache_file_path()
+        self.refresh_thread = None
 
     def get_cache_file_path(self):
         cache_dir = Path(os.path.expanduser("~")) / ".cache" / "vcandy"
         cache_dir.mkdir(parents=True, exist_ok=True)
         return cache_dir / "packages.json"
 
-    def download_json_file(self, url, file_path, max_retries=3, retry_delay=1):
+    def get_metadata_file_path(self, file_path):
+        return Path(f"{file_path}.meta")
+
+    def read_metadata(self, file_path):
+        """Return the stored ETag/Last-Modified validators of a cached file."""
+        try:
+            with open(self.get_metadata_file_path(file_path), "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def write_atomic(self, file_path, content):
+        """Write bytes to a temp file next to file_path and rename it over."""
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".packages-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def download_json_file(self, url, file_path, max_retries=3, retry_delay=1, quiet=False):
+        headers = {}
+        if os.path.exists(file_path):
+            metadata = self.read_metadata(file_path)
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+
         retries = 0
         while retries < max_retries:
             try:
-                response = requests.get(url)
+                response = requests.get(url, headers=headers, timeout=30)
+                if response.status_code == 304:
+                    os.utime(file_path)
+                    return True
                 response.raise_for_status()
-                with open(file_path, "w") as file:
-                    json.dump(response.json(), file)
+                json.loads(response.content)
+                self.write_atomic(file_path, response.content)
+                metadata = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }
+                self.write_atomic(
+                    self.get_metadata_file_path(file_path),
+                    json.dumps(metadata).encode("utf-8"),
+                )
                 return True
-            except requests.exceptions.RequestException as e:
+            except (requests.exceptions.RequestException, ValueError) as e:
                 retries += 1
-                print(f"Failed to download JSON file (Attempt {retries}/{max_retries}): {e}")
+                if not quiet:
+                    print(f"Failed to download JSON file (Attempt {retries}/{max_retries}): {e}")
                 if retries < max_retries:
-                    print(f"Retrying in {retry_delay} seconds...")
+                    if not quiet:
+                        print(f"Retrying in {retry_delay} seconds...")
                     time.sleep(retry_delay)
         return False
 
-    def load_json_data(self, json_file_path=None, refresh=False):
+    def refresh_in_background(self, json_file_path, on_update=None):
+        """Refresh the cached JSON file on a daemon thread.
+
+        on_update is called with the new data once a changed file is in place.
+        """
+
+        def refresh():
+            # A 304 only touches the file; a new download replaces the inode.
+            inode = os.stat(json_file_path).st_ino
+            if not self.download_json_file(self.json_file_url, json_file_path, quiet=True):
+                return
+            if on_update and os.stat(json_file_path).st_ino != inode:
+                try:
+                    with open(json_file_path, "r") as file:
+                        on_update(json.load(file))
+                except (OSError, json.JSONDecodeError):
+                    pass
+
+        thread = threading.Thread(target=refresh, name="vcandy-json-refresh", daemon=True)
+        thread.start()
+        return thread
+
+    def load_json_data(self, json_file_path=None, refresh=False, background=False, on_update=None):
         json_file_path = json_file_path or self.json_file_path
         try:
             if os.path.exists(json_file_path):
                 file_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getmtime(json_file_path))
-                if (file_age > datetime.timedelta(days=1) or refresh):
+                if background and file_age > datetime.timedelta(days=1) and not refresh:
+                    self.refresh_thread = self.refresh_in_background(json_file_path, on_update)
+                elif (file_age > datetime.timedelta(days=1) or refresh):
                     print(f"Updating JSON file from {self.json_file_url}...")
-                    os.remove(json_file_path)
                     if not self.download_json_file(self.json_file_url, json_file_path):
-                        raise RuntimeError(f"Failed to update JSON file from {self.json_file_url}.")
+                        print(f"Failed to update JSON file from {self.json_file_url}. Using the cached copy.")
             else:
                 print(f"Downloading JSON data file from {self.json_file_url}...")
                 if not self.download_json_file(self.json_file_url, json_file_path):
@@ -52,4 +122,111 @@ class PackagesJSONHandler:
         except (json.JSONDecodeError, requests.exceptions.RequestException) as e:
             raise RuntimeError(f"Error retrieving or decoding JSON: {e}")
         except Exception as e:
-            raise RuntimeError(f"An error occurred: {e}")
\ No newline at end of file
+            raise RuntimeError(f"An error occurred: {e}")
+
+
+class PackagesCatalog:
+    """In-memory packages.json with per-distro and per-bundle indexes."""
+
+    def __init__(self, packages_data=None):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.packages_data = {}
+        self.bundle_index = {}
+        self.bundle_index_lower = {}
+        if packages_data is not None:
+            self.update(packages_data)
+
+    def build_indexes(self, packages_data):
+        bundle_index = {}
+        bundle_index_lower = {}
+        for linux_distro, bundles in packages_data.items():
+            bundle_index[linux_distro] = {
+                bundle.get("name", ""): bundle for bundle in bundles
+            }
+            bundle_index_lower[linux_distro] = {
+                bundle.get("name", "").lower(): bundle for bundle in bundles
+            }
+        return bundle_index, bundle_index_lower
+
+    def update(self, packages_data):
+        """Swap in new catalog data; holders of this object see it immediately."""
+        bundle_index, bundle_index_lower = self.build_indexes(packages_data)
+        with self.lock:
+            self.packages_data = packages_data
+            self.bundle_index = bundle_index
+            self.bundle_index_lower = bundle_index_lower
+            self.generation += 1
+
+    def load(self, packages_data):
+        """Fill an empty catalog, unless a background refresh already did."""
+        bundle_index, bundle_index_lower = self.build_indexes(packages_data)
+        with self.lock:
+            if self.generation:
+                return
+            self.packages_data = packages_data
+            self.bundle_index = bundle_index
+            self.bundle_index_lower = bundle_index_lower
+            self.generation = 1
+
+    def __contains__(self, linux_distro):
+        return linux_distro in self.bundle_index
+
+    def bundle_names(self, linux_distro):
+        """Return the bundle names of a distribution in catalog order."""
+        return list(self.bundle_index.get(linux_distro, {}))
+
+    def get_bundle(self, linux_distro, bundle_name):
+        """Return a bundle by exact or case-insensitive name, or None."""
+        bundle = self.bundle_index.get(linux_distro, {}).get(bundle_name)
+        if bundle is None:
+            bundle = self.bundle_index_lower.get(linux_distro, {}).get(
+                bundle_name.lower()
+            )
+        return bundle
+
+    def get_values(self, linux_distro, bundle_name):
+        """Return the install steps of a bundle, or an empty list."""
+        bundle = self.get_bundle(linux_distro, bundle_name)
+        return bundle.get("values", []) if bundle else []
+
+
+_packages_catalog = None
+_refresh_thread = None
+
+# How long a run waits at exit for a background refresh to land.
+REFRESH_WAIT_SECONDS = 10
+
+
+def get_packages_catalog(refresh=False, background_refresh=False, live_update=False):
+    """Load packages.json once per process and return the shared catalog.
+
+    With background_refresh an expired cache is served as is and refreshed
+    for the next run. With live_update too, the catalog is updated in place
+    when the refreshed file arrives; only the terminal UI can follow that.
+    """
+    global _packages_catalog, _refresh_thread
+    if _packages_catalog is None or refresh:
+        handler = PackagesJSONHandler()
+        # The catalog exists before the refresh thread can call back into it.
+        catalog = PackagesCatalog()
+        catalog.load(
+            handler.load_json_data(
+                refresh=refresh,
+                background=background_refresh,
+                on_update=catalog.update if live_update else None,
+            )
+        )
+        _packages_catalog = catalog
+        _refresh_thread = handler.refresh_thread
+    return _packages_catalog
+
+
+def wait_for_background_refresh(timeout=REFRESH_WAIT_SECONDS):
+    """Give a running background refresh up to timeout seconds to finish.
+
+    The refresh thread is a daemon, so a short run would otherwise exit in
+    the middle of the download and the next run would not get the file.
+    """
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        _refresh_thread.join(timeout)
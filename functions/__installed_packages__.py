@@ -0,0 +1,81 @@
+from subprocess import PIPE
+import threading
+
+from functions.__command_runner__ import run
+from functions.__dpkg_status__ import installed_dpkg_packages
+from functions.__pacman_database__ import installed_pacman_packages
+
+# Native database readers return None when the database is unavailable, in
+# which case the snapshot falls back to the package manager's query command.
+SNAPSHOT_READERS = {
+    "arch": installed_pacman_packages,
+    "debian": installed_dpkg_packages,
+    "ubuntu": installed_dpkg_packages,
+}
+
+SNAPSHOT_COMMANDS = {
+    "arch": ["pacman", "-Qq"],
+    "debian": ["dpkg-query", "-W", "-f=${Package}\t${db:Status-Status}\n"],
+    "ubuntu": ["dpkg-query", "-W", "-f=${Package}\t${db:Status-Status}\n"],
+    "fedora": ["rpm", "-qa", "--qf", "%{NAME}\n"],
+}
+
+
+class InstalledPackagesSnapshot:
+    """Set of installed package names, queried once and reused until invalidated."""
+
+    def __init__(self, linux_distro):
+        self.linux_distro = linux_distro
+        self.installed = None
+        self.lock = threading.Lock()
+
+    def query(self):
+        """Read or query the distribution's package database for installed names."""
+        reader = SNAPSHOT_READERS.get(self.linux_distro)
+        installed = reader() if reader else None
+        if installed is not None:
+            return installed
+
+        result = run(
+            SNAPSHOT_COMMANDS[self.linux_distro],
+            stdout=PIPE,
+            stderr=PIPE,
+            text=True,
+        )
+        installed = set()
+        for line in result.stdout.splitlines():
+            name, _, status = line.partition("\t")
+            if name and status in {"", "installed"}:
+                installed.add(name)
+        return installed
+
+    def packages(self):
+        # Steps on other threads may invalidate the snapshot at any time.
+        with self.lock:
+            installed = self.installed
+            if installed is None:
+                installed = self.installed = self.query()
+        return installed
+
+    def is_installed(self, name):
+        return name in self.packages()
+
+    def missing(self, names):
+        """Return the names that are not installed, keeping their order."""
+        installed = self.packages()
+        return [name for name in names if name not in installed]
+
+    def invalidate(self):
+        """Forget the snapshot after packages were installed or removed."""
+        with self.lock:
+            self.installed = None
+
+
+_snapshots = {}
+
+
+def get_installed_snapshot(linux_distro):
+    """Return the process-wide installed-packages snapshot of a distribution."""
+    if linux_distro not in _snapshots:
+        _snapshots[linux_distro] = InstalledPackagesSnapshot(linux_distro)
+    return _snapshots[linux_distro]
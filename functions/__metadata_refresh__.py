@@ -0,0 +1,110 @@
+from glob import glob
+from os import path
+from pathlib import Path
+import time
+
+from functions.__command_runner__ import run
+
+# command, metadata directories, repository definition paths. Arch is left
+# out on purpose: pacman -Sy followed by pacman -S is a partial upgrade.
+METADATA_REFRESH = {
+    "debian": (
+        ["sudo", "apt", "update"],
+        ["/var/lib/apt/lists"],
+        ["/etc/apt/sources.list", "/etc/apt/sources.list.d/*"],
+    ),
+    "ubuntu": (
+        ["sudo", "apt", "update"],
+        ["/var/lib/apt/lists"],
+        ["/etc/apt/sources.list", "/etc/apt/sources.list.d/*"],
+    ),
+    "fedora": (
+        ["sudo", "dnf", "makecache"],
+        ["/var/cache/dnf", "/var/cache/libdnf5"],
+        ["/etc/yum.repos.d/*"],
+    ),
+}
+
+# Catalog install_script lines that only refresh repository metadata.
+METADATA_REFRESH_COMMANDS = {
+    "sudo apt update",
+    "sudo apt-get update",
+    "sudo dnf makecache",
+}
+
+DEFAULT_MAX_AGE_MINUTES = 60
+
+
+def is_metadata_refresh_command(command):
+    return " ".join(command.split()) in METADATA_REFRESH_COMMANDS
+
+
+class MetadataRefresher:
+    """Refresh package-manager metadata at most once while it is fresh.
+
+    Metadata counts as stale when it is older than max_age_minutes or when a
+    repository definition was changed after the last refresh.
+    """
+
+    def __init__(self, linux_distro, max_age_minutes=DEFAULT_MAX_AGE_MINUTES):
+        self.linux_distro = linux_distro
+        self.max_age_minutes = max_age_minutes
+        self.command, self.metadata_paths, self.repository_patterns = (
+            METADATA_REFRESH[linux_distro]
+        )
+        self.stamp_file = (
+            Path(path.expanduser("~")) / ".cache" / "vcandy" / f"metadata-{linux_distro}.stamp"
+        )
+
+    def last_refresh(self):
+        """Return the newest refresh time seen by us or by the package manager."""
+        times = [
+            path.getmtime(metadata_path)
+            for metadata_path in self.metadata_paths + [str(self.stamp_file)]
+            if path.exists(metadata_path)
+        ]
+        return max(times, default=0)
+
+    def last_repository_change(self):
+        times = [
+            path.getmtime(repository_path)
+            for pattern in self.repository_patterns
+            for repository_path in glob(pattern)
+        ]
+        return max(times, default=0)
+
+    def is_fresh(self):
+        last_refresh = self.last_refresh()
+        if time.time() - last_refresh > self.max_age_minutes * 60:
+            return False
+        return self.last_repository_change() <= last_refresh
+
+    def refresh(self, hide, force=False):
+        """Run the metadata refresh unless the metadata is still fresh."""
+        if not force and self.is_fresh():
+            return False
+        print("Refreshing package manager metadata...")
+        result = run(self.command, stderr=hide, stdout=hide)
+        if result.returncode == 0:
+            self.stamp_file.parent.mkdir(parents=True, exist_ok=True)
+            self.stamp_file.touch()
+        return True
+
+
+_refreshers = {}
+_max_age_minutes = DEFAULT_MAX_AGE_MINUTES
+
+
+def configure_metadata_refresh(max_age_minutes):
+    """Set the metadata age, in minutes, below which refreshes are skipped."""
+    global _max_age_minutes
+    _max_age_minutes = max_age_minutes
+    for refresher in _refreshers.values():
+        refresher.max_age_minutes = max_age_minutes
+
+
+def get_metadata_refresher(linux_distro):
+    """Return the process-wide metadata refresher of a distribution."""
+    if linux_distro not in _refreshers:
+        _refreshers[linux_distro] = MetadataRefresher(linux_distro, _max_age_minutes)
+    return _refreshers[linux_distro]
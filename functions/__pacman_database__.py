@@ -0,0 +1,61 @@
+from os import path, scandir
+
+PACMAN_LOCAL_DB = "/var/lib/pacman/local"
+
+_database_cache = {}
+
+
+def read_pacman_desc(desc_file):
+    """Return (name, version) from a pacman desc file, reading only its header."""
+    name = version = None
+    with open(desc_file, "r", encoding="utf-8", errors="replace") as file:
+        field = None
+        for line in file:
+            line = line.strip()
+            if line.startswith("%") and line.endswith("%"):
+                field = line
+            elif line and field == "%NAME%":
+                name = line
+            elif line and field == "%VERSION%":
+                version = line
+            if name and version:
+                break
+    return name, version
+
+
+def read_pacman_database(local_db=PACMAN_LOCAL_DB):
+    """Return {package: version} for every package in the pacman local database.
+
+    The database directory is scanned once and the result is cached until
+    its mtime changes, which pacman bumps whenever it adds or removes an entry.
+    """
+    modified = path.getmtime(local_db)
+    cached = _database_cache.get(local_db)
+    if cached and cached[0] == modified:
+        return cached[1]
+
+    index = {}
+    with scandir(local_db) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            try:
+                name, version = read_pacman_desc(path.join(entry.path, "desc"))
+            except OSError:
+                name = version = None
+            if not name:
+                # Entries are named "<name>-<pkgver>-<pkgrel>"; neither pkgver
+                # nor pkgrel may contain a hyphen.
+                parts = entry.name.rsplit("-", 2)
+                name, version = parts[0], "-".join(parts[1:])
+            index[name] = version
+
+    _database_cache[local_db] = (modified, index)
+    return index
+
+
+def installed_pacman_packages(local_db=PACMAN_LOCAL_DB):
+    """Return the set of installed package names, or None without a local database."""
+    if not path.isdir(local_db):
+        return None
+    return set(read_pacman_database(local_db))
@@ -0,0 +1,33 @@
+import sys
+import time
+
+_enabled = None
+_paused_seconds = 0
+
+
+def configure_pauses(enabled):
+    """Turn the pauses after user-facing messages on or off.
+
+    By default they are only made when both stdin and stdout are a terminal.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def pauses_enabled():
+    if _enabled is None:
+        return sys.stdin.isatty() and sys.stdout.isatty()
+    return _enabled
+
+
+def pause(milliseconds):
+    """Leave a message on screen for a moment, unless pauses are disabled."""
+    global _paused_seconds
+    if pauses_enabled():
+        time.sleep(milliseconds / 1000)
+        _paused_seconds += milliseconds / 1000
+
+
+def paused_seconds():
+    """Return how long this process has spent idle in pauses."""
+    return _paused_seconds
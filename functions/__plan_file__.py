@@ -0,0 +1,98 @@
+import json
+import time
+
+from functions.__flatpak__ import get_flatpak_state
+
+PLAN_VERSION = 1
+
+# Entry types whose state is known from the installed-packages snapshot.
+SNAPSHOT_TYPES = {"package", "AUR-package", "local-package", "url-package"}
+
+
+def needs_change(entry, action, installed_packages):
+    """Return whether action would change anything for a catalog entry.
+
+    Entries whose state cannot be read up front (services, groups, keys,
+    special installers, ...) always need to run.
+    """
+    check_value = entry.get("check_value", "").split()
+    if entry.get("type") == "remove-package" and check_value:
+        # The step only acts on install, when any of the packages is missing.
+        return action == "install" and bool(installed_packages.missing(check_value))
+    if entry.get("type") == "package-flatpak":
+        missing = get_flatpak_state().missing(check_value)
+    elif entry.get("type") in SNAPSHOT_TYPES and check_value:
+        missing = installed_packages.missing(check_value)
+    else:
+        return True
+    return bool(missing) if action == "install" else not missing
+
+
+def resolve_plan(plan, action, installed_packages):
+    """Drop the steps and transaction entries of a plan that are already done."""
+    resolved = []
+    for step in plan:
+        if step["kind"] == "transaction":
+            entries = [
+                entry
+                for entry in step["entries"]
+                if needs_change(entry, action, installed_packages)
+            ]
+            if entries:
+                resolved.append(dict(step, entries=entries))
+        elif step["kind"] == "entry":
+            if needs_change(step["entry"], action, installed_packages):
+                resolved.append(step)
+        elif not resolved or resolved[-1]["kind"] != "refresh":
+            resolved.append(step)
+
+    while resolved and resolved[-1]["kind"] == "refresh":
+        resolved.pop()
+    return resolved
+
+
+def new_plan_file(distribution, action, bundles, steps, artifacts):
+    """Return the contents of a plan file."""
+    return {
+        "version": PLAN_VERSION,
+        "created": int(time.time()),
+        "distribution": distribution,
+        "action": action,
+        "bundles": list(bundles),
+        "steps": steps,
+        "artifacts": [
+            {"url": url, "sha256": expected_sha256}
+            for url, expected_sha256 in artifacts
+        ],
+    }
+
+
+def plan_artifacts(plan_file):
+    """Return the artifacts of a plan file as (url, sha256) pairs."""
+    return [
+        (artifact["url"], artifact.get("sha256"))
+        for artifact in plan_file.get("artifacts", [])
+    ]
+
+
+def write_plan_file(file_path, plan_file):
+    with open(file_path, "w") as file:
+        json.dump(plan_file, file, separators=(",", ":"))
+        file.write("\n")
+
+
+def read_plan_file(file_path):
+    """Read a plan file, raising ValueError if it is not a supported plan."""
+    try:
+        with open(file_path, "r") as file:
+            plan_file = json.load(file)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{file_path} is not a plan file: {e}")
+    if not isinstance(plan_file, dict) or "steps" not in plan_file:
+        raise ValueError(f"{file_path} is not a plan file.")
+    if plan_file.get("version") != PLAN_VERSION:
+        raise ValueError(
+            f"{file_path} has plan version {plan_file.get('version')}, "
+            f"but version {PLAN_VERSION} is supported."
+        )
+    return plan_file
@@ -0,0 +1,233 @@
+from os import path, read
+from subprocess import PIPE, Popen
+import atexit
+import base64
+import json
+import sys
+import threading
+
+# Hidden argument that makes the program serve as the privileged helper.
+SERVE_ARGUMENT = "--privileged-helper-serve"
+APP_FILE = path.join(path.dirname(path.dirname(path.abspath(__file__))), "app.py")
+
+
+def encode(data):
+    return base64.b64encode(data or b"").decode()
+
+
+def decode(data):
+    return base64.b64decode(data or "")
+
+
+def helper_command():
+    """Return the command that starts this program as the helper."""
+    if getattr(sys, "frozen", False):
+        # A PyInstaller build has no separate script to hand to Python.
+        return [sys.executable, SERVE_ARGUMENT]
+    return [sys.executable, APP_FILE, SERVE_ARGUMENT]
+
+
+def serve_request(request, send):
+    """Run one request, sending its output as it arrives and then its exit code."""
+    request_id = request.get("id")
+
+    def forward(stream, name):
+        for chunk in iter(lambda: read(stream.fileno(), 65536), b""):
+            send({"id": request_id, "stream": name, "data": encode(chunk)})
+
+    try:
+        process = Popen(
+            request["argv"],
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            cwd=request.get("cwd"),
+        )
+    except (OSError, KeyError, TypeError) as e:
+        send({"id": request_id, "stream": "stderr", "data": encode(f"{e}\n".encode())})
+        send({"id": request_id, "returncode": 127})
+        return
+
+    readers = [
+        threading.Thread(target=forward, args=(process.stdout, "stdout")),
+        threading.Thread(target=forward, args=(process.stderr, "stderr")),
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        process.stdin.write(decode(request.get("input")))
+        process.stdin.close()
+    except OSError:
+        pass
+    for reader in readers:
+        reader.join()
+    send({"id": request_id, "returncode": process.wait()})
+
+
+def serve(requests=sys.stdin, responses=sys.stdout):
+    """Run the commands sent as JSON lines and answer with JSON lines.
+
+    This is the helper side: it is started once with sudo and runs every
+    request as root until its input is closed. Requests run concurrently;
+    every message of the answer carries the ID of its request.
+    """
+    lock = threading.Lock()
+
+    def send(message):
+        with lock:
+            responses.write(json.dumps(message) + "\n")
+            responses.flush()
+
+    workers = []
+    for line in requests:
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        worker = threading.Thread(target=serve_request, args=(request, send))
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+
+
+class PendingCommand:
+    """A request sent to the helper that is waiting for its exit code."""
+
+    def __init__(self, on_stdout, on_stderr):
+        self.handlers = {"stdout": on_stdout, "stderr": on_stderr}
+        self.returncode = None
+        self.done = threading.Event()
+
+    def output(self, stream, data):
+        handler = self.handlers[stream]
+        if handler:
+            handler(data)
+
+    def finish(self, returncode):
+        self.returncode = returncode
+        self.done.set()
+
+
+class PrivilegedHelper:
+    """Client of a root helper process started with a single sudo.
+
+    Commands that would each be prefixed with sudo are sent to the helper
+    over its stdin instead, so credentials are checked once per run and
+    cannot time out halfway through a long install. Several commands can
+    run at once; a reader thread hands each answer to the waiting caller.
+    """
+
+    def __init__(self):
+        self.process = None
+        self.pending = {}
+        self.next_id = 0
+        self.lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def start(self):
+        self.process = Popen(
+            ["sudo"] + helper_command(),
+            stdin=PIPE,
+            stdout=PIPE,
+            text=True,
+        )
+        threading.Thread(
+            target=self.read_responses,
+            args=(self.process,),
+            name="vcandy-privileged-helper",
+            daemon=True,
+        ).start()
+
+    def stop(self):
+        with self.lock:
+            process = self.process
+        if process and process.poll() is None:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            process.wait()
+
+    def read_responses(self, process):
+        """Pass the helper's messages to their commands until it goes away."""
+        error = b"The privileged helper exited unexpectedly.\n"
+        for line in process.stdout:
+            try:
+                message = json.loads(line)
+                with self.lock:
+                    command = self.pending[message["id"]]
+                if "returncode" in message:
+                    with self.lock:
+                        del self.pending[message["id"]]
+                    command.finish(message["returncode"])
+                else:
+                    command.output(message["stream"], decode(message["data"]))
+            except (ValueError, KeyError, TypeError):
+                error = b"The privileged helper sent a malformed response.\n"
+                break
+
+        with self.lock:
+            if self.process is process:
+                self.process = None
+            failed = list(self.pending.values())
+            self.pending.clear()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        for command in failed:
+            command.output("stderr", error)
+            command.finish(1)
+
+    def execute(self, argv, input=None, cwd=None, on_stdout=None, on_stderr=None):
+        """Run argv as root, streaming its output to the callbacks.
+
+        Returns the exit code; a helper that exits or answers garbage fails
+        the command with exit code 1.
+        """
+        if isinstance(input, str):
+            input = input.encode()
+        command = PendingCommand(on_stdout, on_stderr)
+        with self.lock:
+            if self.process is None:
+                self.start()
+            self.next_id += 1
+            request = {
+                "id": self.next_id,
+                "argv": argv,
+                "input": encode(input),
+                "cwd": cwd,
+            }
+            self.pending[request["id"]] = command
+            try:
+                self.process.stdin.write(json.dumps(request) + "\n")
+                self.process.stdin.flush()
+            except OSError:
+                del self.pending[request["id"]]
+                command.output(
+                    "stderr", b"The privileged helper exited unexpectedly.\n"
+                )
+                command.finish(1)
+        command.done.wait()
+        return command.returncode
+
+
+_helper = None
+_enabled = False
+
+
+def configure_privileged_helper(enabled):
+    """Route sudo commands through one privileged helper process."""
+    global _enabled
+    _enabled = enabled
+
+
+def get_privileged_helper():
+    """Return the process-wide helper, or None when it is not enabled."""
+    global _helper
+    if not _enabled:
+        return None
+    if _helper is None:
+        _helper = PrivilegedHelper()
+    return _helper
@@ -0,0 +1,129 @@
+import json
+import re
+import threading
+
+from functions.__command_runner__ import get_command_runner
+
+# Install script lines that only install packages from the repositories.
+INSTALL_COMMAND = re.compile(r"^sudo (apt|apt-get|dnf) install ([\w.+\- ]+)$")
+
+
+def entry_identity(entry):
+    """Return the canonical identity of a catalog entry.
+
+    Two entries that differ only in their display name do the same work,
+    e.g. the flathub remote or the libvirt group of different bundles.
+    """
+    return json.dumps(
+        {key: value for key, value in entry.items() if key != "name"}, sort_keys=True
+    )
+
+
+def install_command_packages(command):
+    """Return (package manager, packages, options) of an install line, or None."""
+    match = INSTALL_COMMAND.match(" ".join(command.split()))
+    if not match:
+        return None
+    words = match.group(2).split()
+    packages = [word for word in words if not word.startswith("-")]
+    options = [word for word in words if word.startswith("-")]
+    package_manager = "apt" if match.group(1) == "apt-get" else match.group(1)
+    return package_manager, packages, options
+
+
+class StepDeduplicator:
+    """Run each distinct step once per run, whichever bundles it appears in.
+
+    Steps are identified by entry_identity. Later occurrences wait for the
+    first one to finish and are then skipped. Install script lines are
+    reduced to the packages no earlier line of the run installed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget the steps of the previous run."""
+        self.steps = {}
+        self.invocations = {}
+        self.installed = set()
+        self.eliminated = []
+
+    def record(self, label, invocations=1):
+        """Count invocations of label as eliminated duplicates."""
+        with self.lock:
+            self.eliminated.append((label, invocations))
+
+    def run_once(self, identity, label, action):
+        """Run action unless a step with the same identity already ran."""
+        with self.lock:
+            first = identity not in self.steps
+            if first:
+                self.steps[identity] = threading.Event()
+            done = self.steps[identity]
+
+        if not first:
+            done.wait()
+            print(f"Skipping {label}: the same step already ran.")
+            self.record(label, self.invocations.get(identity, 0))
+            return
+
+        with get_command_runner().record_scope() as records:
+            try:
+                action()
+            finally:
+                self.invocations[identity] = len(records)
+                done.set()
+
+    def run_script_command(self, command, execute):
+        """Run an install script line through execute without repeated packages.
+
+        execute is called with the command to run and returns its
+        CompletedProcess. Returns None when the line was skipped.
+        """
+        parsed = install_command_packages(command)
+        if not parsed:
+            return execute(command)
+
+        package_manager, packages, options = parsed
+        with self.lock:
+            remaining = [
+                package
+                for package in packages
+                if (package_manager, package) not in self.installed
+            ]
+        if not remaining:
+            print(f"Skipping {command}: its packages were installed earlier.")
+            self.record(command)
+            return None
+
+        if remaining != packages:
+            command = " ".join(command.split()[:3] + remaining + options)
+        result = execute(command)
+        if result.returncode == 0:
+            with self.lock:
+                self.installed.update(
+                    (package_manager, package) for package in remaining
+                )
+        return result
+
+    def report(self):
+        """Print how many duplicate command invocations were not run."""
+        with self.lock:
+            eliminated = list(self.eliminated)
+        if not eliminated:
+            return
+        total = sum(invocations for _, invocations in eliminated)
+        print(
+            f"Deduplicated {len(eliminated)} repeated steps, "
+            f"saving {total} command invocations."
+        )
+
+
+_deduplicator = StepDeduplicator()
+
+
+def get_step_deduplicator():
+    """Return the process-wide step deduplicator."""
+    return _deduplicator
@@ -0,0 +1,62 @@
+from os import path, remove, replace
+import json
+import tempfile
+
+
+def normalize_inputs(inputs):
+    """Return inputs as they read back from JSON, so that they compare equal."""
+    return json.loads(json.dumps(inputs, sort_keys=True))
+
+
+class StepManifest:
+    """Record of completed install steps and the inputs they ran with.
+
+    A step is skipped on the next run while its inputs (versions, kernel
+    release, file hashes, ...) are the same as when it last succeeded.
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = str(manifest_file)
+        self.steps = self.read()
+
+    def read(self):
+        try:
+            with open(self.manifest_file, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def write(self):
+        fd, temp_path = tempfile.mkstemp(
+            dir=path.dirname(self.manifest_file), prefix=".manifest-"
+        )
+        with open(fd, "w") as file:
+            json.dump(self.steps, file, indent=2, sort_keys=True)
+        replace(temp_path, self.manifest_file)
+
+    def is_done(self, step, inputs):
+        return self.steps.get(step) == normalize_inputs(inputs)
+
+    def mark_done(self, step, inputs):
+        self.steps[step] = normalize_inputs(inputs)
+        self.write()
+
+    def clear(self):
+        self.steps = {}
+        if path.exists(self.manifest_file):
+            remove(self.manifest_file)
+
+    def run_step(self, step, get_inputs, action):
+        """Run action unless step already succeeded with the current inputs.
+
+        get_inputs is called before and again after the action, so inputs
+        that only exist once the step ran (e.g. hashes of downloaded files)
+        are recorded too. An action returning False is not recorded.
+        """
+        if self.is_done(step, get_inputs()):
+            print(f"Skipping {step}: already done with the same inputs.")
+            return True
+        if action() is False:
+            return False
+        self.mark_done(step, get_inputs())
+        return True
@@ -0,0 +1,176 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+
+# Steps of these types run the system package manager, which holds a global
+# lock, so at most one of them runs at a time.
+PACKAGE_MANAGER_TYPES = {
+    "package",
+    "url-package",
+    "local-package",
+    "remove-package",
+    "special-package",
+    "AUR-package",
+    "get-keys",
+}
+FLATPAK_TYPES = {"repo-flathub", "package-flatpak"}
+# Steps that need the repository metadata of the last refresh before them.
+METADATA_TYPES = {"package", "url-package", "local-package", "AUR-package"}
+
+DEFAULT_MAX_WORKERS = 4
+
+_max_workers = DEFAULT_MAX_WORKERS
+
+
+def configure_max_workers(max_workers):
+    """Set how many install steps may run at the same time."""
+    global _max_workers
+    _max_workers = max_workers
+
+
+def get_max_workers():
+    return _max_workers
+
+
+def step_type(step):
+    if step["kind"] == "entry":
+        return step["entry"].get("type", "")
+    return step.get("type", "")
+
+
+def step_resource(step):
+    """Return the lock a step must hold while it runs, or None."""
+    if step["kind"] == "refresh":
+        return "package-manager"
+    if step_type(step) in PACKAGE_MANAGER_TYPES:
+        return "package-manager"
+    if step_type(step) in FLATPAK_TYPES:
+        return "flatpak"
+    return None
+
+
+def step_bundles(step):
+    if step["kind"] == "entry":
+        return [step["bundle"]]
+    return step.get("bundles", [])
+
+
+def step_label(step):
+    if step["kind"] == "entry":
+        return step["entry"].get("name", "")
+    if step["kind"] == "transaction":
+        return f"{step['type']} transaction ({', '.join(step['bundles'])})"
+    return "metadata refresh"
+
+
+def build_step_graph(plan):
+    """Return, for each plan step, the indexes of the steps it waits for.
+
+    A step follows the previous step of each of its bundles. A metadata
+    refresh follows every earlier package-manager step, and the steps that
+    resolve packages follow the last refresh before them.
+    """
+    dependencies = []
+    last_of_bundle = {}
+    last_refresh = None
+    package_manager_steps = []
+
+    for index, step in enumerate(plan):
+        depends_on = {
+            last_of_bundle[bundle]
+            for bundle in step_bundles(step)
+            if bundle in last_of_bundle
+        }
+        if step["kind"] == "refresh":
+            depends_on.update(package_manager_steps)
+            last_refresh = index
+        elif step_type(step) in METADATA_TYPES and last_refresh is not None:
+            depends_on.add(last_refresh)
+
+        if step_resource(step) == "package-manager":
+            package_manager_steps.append(index)
+        for bundle in step_bundles(step):
+            last_of_bundle[bundle] = index
+        dependencies.append(depends_on)
+
+    return dependencies
+
+
+class StepScheduler:
+    """Run plan steps in dependency order with bounded parallelism.
+
+    Independent steps run concurrently on up to max_workers threads; steps
+    sharing a resource (package manager, flatpak) never overlap.
+    """
+
+    def __init__(self, plan, run_step, max_workers=None):
+        self.plan = plan
+        self.run_step = run_step
+        self.max_workers = max(1, max_workers or get_max_workers())
+        self.dependencies = build_step_graph(plan)
+        self.durations = {}
+
+    def timed_run(self, index):
+        start = time.monotonic()
+        try:
+            self.run_step(self.plan[index])
+        finally:
+            self.durations[index] = time.monotonic() - start
+
+    def run(self):
+        pending = list(range(len(self.plan)))
+        done = set()
+        busy_resources = set()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for index in list(pending):
+                    if len(running) >= self.max_workers:
+                        break
+                    resource = step_resource(self.plan[index])
+                    if not self.dependencies[index] <= done:
+                        continue
+                    if resource and resource in busy_resources:
+                        continue
+                    if resource:
+                        busy_resources.add(resource)
+                    pending.remove(index)
+                    running[pool.submit(self.timed_run, index)] = index
+
+                if not running:
+                    raise RuntimeError("Install steps have unsatisfiable dependencies.")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index = running.pop(future)
+                    busy_resources.discard(step_resource(self.plan[index]))
+                    done.add(index)
+                    future.result()
+
+    def critical_path(self):
+        """Return (seconds, [steps]) of the longest dependency chain by duration."""
+        finish = {}
+        previous = {}
+        for index in range(len(self.plan)):
+            start = 0
+            for dependency in self.dependencies[index]:
+                if finish.get(dependency, 0) > start:
+                    start = finish[dependency]
+                    previous[index] = dependency
+            finish[index] = start + self.durations.get(index, 0)
+
+        if not finish:
+            return 0, []
+        index = max(finish, key=finish.get)
+        total = finish[index]
+        path = [index]
+        while index in previous:
+            index = previous[index]
+            path.append(index)
+        return total, [self.plan[index] for index in reversed(path)]
+
+    def report(self):
+        total, path = self.critical_path()
+        if path:
+            steps = " -> ".join(step_label(step) for step in path)
+            print(f"Critical path ({total:.1f}s): {steps}")
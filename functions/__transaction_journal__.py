@@ -0,0 +1,114 @@
+from hashlib import sha256
+from os import fsync, path, replace
+from pathlib import Path
+import json
+import tempfile
+import threading
+import time
+
+JOURNAL_FILE = Path(path.expanduser("~")) / ".cache" / "vcandy" / "journal.jsonl"
+
+
+def plan_id(run_id, plan):
+    """Return an ID that is the same for every run of the same plan."""
+    data = json.dumps({"run": run_id, "plan": plan}, sort_keys=True)
+    return sha256(data.encode()).hexdigest()
+
+
+def step_id(index, step):
+    data = json.dumps(step, sort_keys=True)
+    return f"{index}:{sha256(data.encode()).hexdigest()[:16]}"
+
+
+class TransactionJournal:
+    """Append-only record of the completed steps of the current plan.
+
+    Every record is a JSON line that is flushed and fsync'd before the run
+    continues. If a run is interrupted, the next run of the same plan finds
+    the plan unfinished and skips the steps journaled as done.
+    """
+
+    def __init__(self, journal_file=JOURNAL_FILE, resume=True):
+        self.journal_file = str(journal_file)
+        self.resume = resume
+        self.plan = None
+        self.lock = threading.Lock()
+
+    def read(self):
+        records = []
+        try:
+            with open(self.journal_file, "r") as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A record torn by the interruption was not committed.
+                        break
+        except OSError:
+            pass
+        return records
+
+    def append(self, record):
+        with open(self.journal_file, "a") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            fsync(file.fileno())
+
+    def restart(self, record):
+        """Replace the journal with a single record."""
+        Path(self.journal_file).parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=path.dirname(self.journal_file), prefix=".journal-"
+        )
+        with open(fd, "w") as file:
+            file.write(json.dumps(record) + "\n")
+            file.flush()
+            fsync(file.fileno())
+        replace(temp_path, self.journal_file)
+
+    def begin(self, plan):
+        """Start or resume a plan and return the IDs of its completed steps."""
+        records = self.read()
+        self.plan = plan
+        if (
+            self.resume
+            and records
+            and records[0].get("plan") == plan
+            and not any(record.get("event") == "end" for record in records)
+        ):
+            self.append({"event": "resume", "plan": plan, "time": int(time.time())})
+            return {
+                record["step"] for record in records if record.get("event") == "step"
+            }
+        self.restart({"event": "begin", "plan": plan, "time": int(time.time())})
+        return set()
+
+    def commit(self, step, label=""):
+        with self.lock:
+            self.append(
+                {"event": "step", "plan": self.plan, "step": step, "label": label}
+            )
+
+    def finish(self):
+        with self.lock:
+            self.append({"event": "end", "plan": self.plan, "time": int(time.time())})
+
+
+_journal = None
+_resume = True
+
+
+def configure_journal(resume):
+    """Set whether an interrupted run of the same plan is resumed."""
+    global _resume
+    _resume = resume
+    if _journal is not None:
+        _journal.resume = resume
+
+
+def get_transaction_journal():
+    """Return the process-wide transaction journal."""
+    global _journal
+    if _journal is None:
+        _journal = TransactionJournal(resume=_resume)
+    return _journal
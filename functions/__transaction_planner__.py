@@ -0,0 +1,145 @@
+from functions.__command_runner__ import get_command_runner
+from functions.__pauses__ import paused_seconds
+from functions.__step_dedup__ import (
+    entry_identity,
+    get_step_deduplicator,
+    install_command_packages,
+)
+from functions.__step_scheduler__ import StepScheduler, step_label
+from functions.__transaction_journal__ import (
+    get_transaction_journal,
+    plan_id,
+    step_id,
+)
+
+BATCHABLE_TYPES = {"package", "package-flatpak"}
+
+# Entries that make the package manager resolve packages outside a batched
+# transaction, and so need current repository metadata as well.
+REFRESH_BEFORE_TYPES = {"local-package", "url-package"}
+
+# Transactions that do not use the system package manager's metadata.
+NO_REFRESH_TYPES = {"package-flatpak"}
+
+
+def add_refresh_step(plan):
+    if not plan or plan[-1]["kind"] != "refresh":
+        plan.append({"kind": "refresh"})
+
+
+def needs_refresh_before(entry):
+    """Return whether a non-batched entry needs current repository metadata."""
+    if entry.get("type") in REFRESH_BEFORE_TYPES:
+        return True
+    # Repository key scripts may install their prerequisites, e.g. curl,
+    # before they add the repository.
+    return entry.get("type") == "get-keys" and any(
+        install_command_packages(command)
+        for command in entry.get("install_script", [])
+    )
+
+
+def plan_transactions(bundles, batchable_types=BATCHABLE_TYPES, refresh=True):
+    """Merge the steps of several bundles into an ordered plan with batched transactions.
+
+    bundles maps bundle names to their catalog values. Every bundle keeps its
+    own step order. The plan is built in waves: first the non-batchable steps
+    at the head of every bundle, then the batchable steps now at the heads are
+    merged into one transaction per package type.
+
+    Returns a list of steps, either
+    {"kind": "entry", "bundle": name, "entry": value},
+    {"kind": "transaction", "type": package_type, "bundles": [...], "entries": [...]}
+    or {"kind": "refresh"}, which precedes every step that needs current
+    repository metadata and so comes after the repository steps before it.
+    Distributions without a separate refresh pass refresh=False.
+    """
+    queues = [(bundle_name, list(values)) for bundle_name, values in bundles.items()]
+    plan = []
+
+    while any(values for _, values in queues):
+        for bundle_name, values in queues:
+            while values and values[0].get("type") not in batchable_types:
+                if refresh and needs_refresh_before(values[0]):
+                    add_refresh_step(plan)
+                plan.append(
+                    {"kind": "entry", "bundle": bundle_name, "entry": values.pop(0)}
+                )
+
+        transactions = {}
+        for bundle_name, values in queues:
+            # Only a run of one type is taken per wave, so that a bundle's
+            # "package" and e.g. "AUR-package" steps keep their relative order.
+            package_type = values[0].get("type") if values else None
+            while values and values[0].get("type") == package_type:
+                transaction = transactions.setdefault(
+                    package_type,
+                    {"kind": "transaction", "type": package_type, "bundles": [], "entries": []},
+                )
+                if bundle_name not in transaction["bundles"]:
+                    transaction["bundles"].append(bundle_name)
+                transaction["entries"].append(values.pop(0))
+        if refresh and set(transactions) - NO_REFRESH_TYPES:
+            add_refresh_step(plan)
+        plan.extend(transactions.values())
+
+    return plan
+
+
+def run_transaction_plan(
+    plan, handle_entry, handle_transaction, handle_refresh=None, run_id=None
+):
+    """Execute a plan from plan_transactions with the distro's handlers.
+
+    Steps run on the StepScheduler, so independent steps of different
+    bundles may overlap while package-manager steps stay serialized.
+
+    run_id names what the plan is run for, e.g. "arch install". When it is
+    given, completed steps are journaled, and a rerun of the same plan
+    after an interruption skips them.
+    """
+    journal = get_transaction_journal() if run_id else None
+    done = set()
+    if journal:
+        done = journal.begin(plan_id(run_id, plan))
+        if done:
+            print(f"Resuming an interrupted run: {len(done)} steps are already done.")
+    steps = {id(step): step_id(index, step) for index, step in enumerate(plan)}
+    runner = get_command_runner()
+    get_step_deduplicator().reset()
+
+    def run_step(step):
+        if journal and steps[id(step)] in done:
+            print(f"Skipping {step_label(step)}: done in the interrupted run.")
+            return
+        with runner.record_scope() as records:
+            handle_step(step)
+        # A step is only journaled when none of its own commands failed, so
+        # that failed work is checked again by the next run.
+        if journal and not any(record.failed for record in records):
+            journal.commit(steps[id(step)], step_label(step))
+
+    def handle_step(step):
+        if step["kind"] == "transaction":
+            handle_transaction(step["entries"])
+        elif step["kind"] == "refresh":
+            if handle_refresh:
+                handle_refresh()
+        else:
+            # The same entry in several bundles, e.g. the flathub remote or a
+            # group membership, runs only once.
+            get_step_deduplicator().run_once(
+                entry_identity(step["entry"]),
+                step_label(step),
+                lambda: handle_entry(step["entry"]),
+            )
+
+    scheduler = StepScheduler(plan, run_step)
+    scheduler.run()
+    if journal:
+        journal.finish()
+    scheduler.report()
+    get_command_runner().report()
+    get_step_deduplicator().report()
+    if paused_seconds():
+        print(f"Idle in pauses: {paused_seconds():.1f}s.")
@@ -1,11 +1,24 @@
-from io import BytesIO
-from os import makedirs, path, chdir, listdir
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+from hashlib import sha256
+from os import makedirs, path, listdir, uname
 from pathlib import Path
-from subprocess import run
+from shutil import copyfile, copyfileobj
+from subprocess import PIPE
+import json
 import logging
+import re
+import tarfile
 from zipfile import ZipFile
 import requests
 
+from functions.__command_runner__ import run
+from functions.__download_cache__ import get_download_cache
+from functions.__download_engine__ import file_sha256, progress_printer
+from functions.__step_manifest__ import StepManifest
+from functions.__step_scheduler__ import get_max_workers
+
+
 class VMwareInstaller:
     PKGVER = "17.5.2"
     BUILDVER = "23775571"
@@ -26,6 +39,10 @@ class VMwareInstaller:
         f"vmware-tools-winPreVista-{TOOLS_VERSION}.{CARCH}.component.tar",
     ]
     EXTRACTED_DIR = path.join(CACHE_DIR, "extracted_components")
+    MANIFEST_FILE = path.join(CACHE_DIR, "install_manifest.json")
+    # Built modules per kernel release and patch set. Machines sharing this
+    # directory only compile each combination once.
+    DKMS_CACHE_DIR = path.join(CACHE_DIR, "dkms_tarballs")
     DEPENDENCIES = []
     PACKAGE_MANAGER = ""
     PACKAGE_NAME = "vmware-host-modules"
@@ -42,6 +59,7 @@ class VMwareInstaller:
     SOURCE_DIR = f"{CACHE_DIR}/vmware-host-modules-workstation-17.5.2-k6.9-"
     GITHUB_REPO_URL = "https://github.com/Hakanbaban53/Virtual-CANDY"
     GITHUB_BRANCH = "main"
+    COPY_CHUNK_SIZE = 1024 * 1024
 
     def __init__(self, hide, action, linux_distro):
         self.COMPONENT_URLS = [
@@ -52,6 +70,7 @@ class VMwareInstaller:
         self.action = action
         self.linux_distro = linux_distro
         self.PACKAGE_MANAGER, self.DEPENDENCIES = self._configure_distro()
+        self.manifest = StepManifest(self.MANIFEST_FILE)
 
         if self.action == "install":
             self.install_vmware()
@@ -96,13 +115,8 @@ class VMwareInstaller:
     def _get_kernel_version(self):
         """Retrieve the current kernel version."""
         try:
-            result = run("uname -r", shell=True, text=True, capture_output=True)
-            if result.returncode == 0:
-                return result.stdout.strip()
-            else:
-                logging.error(f"Error retrieving kernel version: {result.stderr}")
-                return None
-        except Exception as e:
+            return uname().release
+        except OSError:
             logging.exception("Exception occurred while retrieving kernel version.")
             return None
 
@@ -117,105 +131,175 @@ class VMwareInstaller:
             ],
         )
 
-    def run_command(self, command):
-        """Run a shell command and logging. Error its output."""
-        result = run(
-            command, shell=True, text=True, stderr=self.hide,
-            stdout=self.hide
-        )
+    def run_command(self, argv, input=None):
+        """Run a command without a shell and log the end of its stderr on failure."""
+        result = run(argv, stderr=self.hide, stdout=self.hide, input=input)
         if result.returncode != 0:
-            logging.error(f"Command failed: {command}")
-            logging.error(f"Error output: {result.stderr}")
-            return False, result.stderr
+            logging.error(f"Command failed: {result.record}")
+            logging.error(f"Error output: {result.record.stderr_tail}")
+            return False, result.record.stderr_tail
         return True, ""
 
     def download_file(self, url, filename):
-        """Download a file from a URL using wget."""
+        """Download a file from a URL through the artifact download cache."""
         logging.info(f"Downloading {filename} from {url}...")
-        self.run_command(f"wget -O {path.join(self.CACHE_DIR, filename)} {url}")
+        try:
+            get_download_cache().fetch_to(
+                url,
+                path.join(self.CACHE_DIR, filename),
+                progress=progress_printer(filename),
+            )
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            logging.error(f"Failed to download {filename}: {e}")
+            return False
         logging.info(f"Downloaded {filename}.\n")
+        return True
+
+    def extract_tar(self, filename, extract_to, skip_suffixes=()):
+        """Extract a tar file, leaving out the members ending with skip_suffixes."""
+        logging.info(f"Extracting {filename} to {extract_to}...")
+        with tarfile.open(path.join(self.CACHE_DIR, filename)) as tar_file:
+            if hasattr(tarfile, "tar_filter"):
+                tar_file.extraction_filter = tarfile.tar_filter
+            members = [
+                member
+                for member in tar_file.getmembers()
+                if not (skip_suffixes and member.name.endswith(skip_suffixes))
+            ]
+            tar_file.extractall(extract_to, members=members)
 
-    def extract_tar(self, filename):
-        """Extract a tar file."""
-        logging.info(f"Extracting {filename} to {self.EXTRACTED_DIR}...")
-        self.run_command(
-            f"tar -xf {path.join(self.CACHE_DIR, filename)} -C {self.EXTRACTED_DIR}"
-        )
-        self.run_command(f"find {self.EXTRACTED_DIR} -name '*.xml' -type f -delete")
+    def download_and_extract_tar(self, url, filename, extract_to, skip_suffixes=()):
+        if not self.download_file(url, filename):
+            return False
+        self.extract_tar(filename, extract_to, skip_suffixes)
+        return True
+
+    def download_and_extract_all(self):
+        """Download the bundle and components concurrently.
+
+        Each file is extracted as soon as its own download finishes, so the
+        total time approaches that of the largest download.
+        """
+        makedirs(self.EXTRACTED_DIR, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=get_max_workers()) as pool:
+            downloads = [
+                pool.submit(
+                    self.download_and_extract_tar,
+                    self.BUNDLE_URL,
+                    self.BUNDLE_FILENAME,
+                    self.CACHE_DIR,
+                )
+            ]
+            for url, filename in zip(self.COMPONENT_URLS, self.COMPONENT_FILENAMES):
+                downloads.append(
+                    pool.submit(
+                        self.download_and_extract_tar,
+                        url,
+                        filename,
+                        self.EXTRACTED_DIR,
+                        (".xml",),
+                    )
+                )
+            succeeded = True
+            for download in downloads:
+                try:
+                    succeeded = download.result() and succeeded
+                except (tarfile.TarError, OSError) as e:
+                    logging.error(f"Failed to extract a VMware archive: {e}")
+                    succeeded = False
+        return succeeded
+
+    def archive_url(self, repo_url, branch):
+        return f"{repo_url}/archive/refs/heads/{branch}.zip"
 
     def download_and_extract_zip(
         self, repo_url, branch, folder_path=None, extract_to=None
     ):
         """Download and extract a GitHub repository or a specific folder."""
         logging.info(f"Downloading repository from {repo_url}...")
-        zip_url = f"{repo_url}/archive/refs/heads/{branch}.zip"
-        response = requests.get(zip_url)
-        if response.status_code != 200:
-            logging.error(
-                f"Failed to download the repository. Status code: {response.status_code}"
+        zip_url = self.archive_url(repo_url, branch)
+        try:
+            zip_path = get_download_cache().fetch(
+                zip_url, progress=progress_printer(f"{branch}.zip")
             )
-            return
+        except (requests.exceptions.RequestException, OSError, ValueError) as e:
+            logging.error(f"Failed to download the repository: {e}")
+            return False
 
-        with ZipFile(BytesIO(response.content)) as zip_file:
+        with ZipFile(zip_path) as zip_file:
             if folder_path:
                 logging.info(f"Extracting the folder '{folder_path}'...")
-                for member in zip_file.namelist():
-                    if member.startswith(
-                        f"{repo_url.split('/')[-1]}-{branch}/{folder_path}"
-                    ):
-                        relative_path = path.relpath(
-                            member, f"{repo_url.split('/')[-1]}-{branch}"
-                        )
-                        target_path = path.join(extract_to, relative_path)
-                        if not member.endswith("/"):
-                            makedirs(path.dirname(target_path), exist_ok=True)
-                            with open(target_path, "wb") as f:
-                                f.write(zip_file.read(member))
-                        else:
-                            makedirs(target_path, exist_ok=True)
+                archive_root = f"{repo_url.split('/')[-1]}-{branch}"
+                for member in zip_file.infolist():
+                    if not member.filename.startswith(f"{archive_root}/{folder_path}"):
+                        continue
+                    relative_path = path.relpath(member.filename, archive_root)
+                    target_path = path.join(extract_to, relative_path)
+                    if member.is_dir():
+                        makedirs(target_path, exist_ok=True)
+                        continue
+                    # Copy in chunks so that memory use does not grow with
+                    # the size of the member.
+                    makedirs(path.dirname(target_path), exist_ok=True)
+                    with zip_file.open(member) as source, open(target_path, "wb") as f:
+                        copyfileobj(source, f, self.COPY_CHUNK_SIZE)
                 logging.info(f"Extracted folder '{folder_path}' to {extract_to}.")
             else:
                 logging.info(f"Extracting the entire repository to {extract_to}...")
                 zip_file.extractall(extract_to)
                 logging.info(f"Extracted repository to {extract_to}.")
+        return True
+
+    def dkms_tarball_path(self, kernel):
+        """Return the DKMS cache tarball for this kernel, sources and patch set."""
+        build_inputs = json.dumps(self.dkms_build_inputs(), sort_keys=True)
+        key = sha256(build_inputs.encode()).hexdigest()[:16]
+        return path.join(
+            self.DKMS_CACHE_DIR,
+            f"{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}-{kernel}-{key}.dkms.tar.gz",
+        )
 
-    def install_vmware_modules(self):
-        """Install VMware modules."""
-        dest_dir = "/usr/lib/vmware/modules/source/"
-        folders_to_copy = ["vmmon-only", "vmnet-only"]
-
-        chdir(self.SOURCE_DIR)
-        logging.info("Copying vmmon and vmnet folders...")
-
-        for folder in folders_to_copy:
-            src_folder = path.join(self.SOURCE_DIR, folder)
-            dest_folder = path.join(dest_dir, folder)
-
-            if not path.exists(dest_folder):
-                self.run_command(f"sudo mkdir -p {dest_folder}")
-
-            logging.info(f"Copying {src_folder} to {dest_folder}...")
-            self.run_command(f"sudo cp -r {src_folder} {dest_folder}")
-
-        logging.info("Folders copied successfully.")
-
+    def build_dkms_modules(self):
+        """Add the patched vmmon and vmnet sources to DKMS and build them."""
         logging.info("Creating directories for DKMS...")
         self.run_command(
-            f"sudo mkdir -p /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}"
+            [
+                "sudo",
+                "mkdir",
+                "-p",
+                f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}",
+            ]
         )
 
         logging.info("Moving source files to DKMS directory...")
         self.run_command(
-            f"sudo cp -r vmmon-only /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/"
+            [
+                "sudo",
+                "cp",
+                "-r",
+                path.join(self.SOURCE_DIR, "vmmon-only"),
+                f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/",
+            ]
         )
         self.run_command(
-            f"sudo cp -r vmnet-only /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/"
+            [
+                "sudo",
+                "cp",
+                "-r",
+                path.join(self.SOURCE_DIR, "vmnet-only"),
+                f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/",
+            ]
         )
 
-
         logging.info("Copying Makefile and dkms.conf to DKMS directory...")
         self.run_command(
-            f"sudo cp -r {self.CACHE_DIR}/vmware_files/DKMS_files/Makefile /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/"
+            [
+                "sudo",
+                "cp",
+                "-r",
+                f"{self.CACHE_DIR}/vmware_files/DKMS_files/Makefile",
+                f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/",
+            ]
         )
 
         logging.info("Creating DKMS configuration for vmware-host-modules...")
@@ -233,125 +317,358 @@ class VMwareInstaller:
             conf_file.write(dkms_conf_vmware_host_modules)
 
         self.run_command(
-            f"sudo mv {temp_conf_path} /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/dkms.conf"
+            [
+                "sudo",
+                "mv",
+                temp_conf_path,
+                f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/dkms.conf",
+            ]
         )
         logging.info(
             f"DKMS configuration file created at /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/dkms.conf"
         )
 
         logging.info("Applying patches...")
-        self.run_command(
-            f"sudo patch -N -p2 -d /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/vmmon-only < {self.CACHE_DIR}/vmware_files/DKMS_files/vmmon.patch"
-        )
-        self.run_command(
-            f"sudo patch -N -p2 -d /usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/vmnet-only < {self.CACHE_DIR}/vmware_files/DKMS_files/vmnet.patch"
-        )
+        for module in ("vmmon", "vmnet"):
+            self.run_command(
+                [
+                    "sudo",
+                    "patch",
+                    "-N",
+                    "-p2",
+                    "-d",
+                    f"/usr/src/{self.PACKAGE_NAME}-{self.PACKAGE_VERSION}/{module}-only",
+                    "-i",
+                    f"{self.CACHE_DIR}/vmware_files/DKMS_files/{module}.patch",
+                ]
+            )
 
         logging.info("Adding and building vmware-host-modules module with DKMS...")
         self.run_command(
-            f"sudo dkms add --force -m {self.PACKAGE_NAME} -v {self.PACKAGE_VERSION}"
+            [
+                "sudo",
+                "dkms",
+                "add",
+                "--force",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+            ]
         )
-        self.run_command(
-            f"sudo dkms build --force -m {self.PACKAGE_NAME} -v {self.PACKAGE_VERSION}"
+        built, _ = self.run_command(
+            [
+                "sudo",
+                "dkms",
+                "build",
+                "--force",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+            ]
         )
-        self.run_command(
-            f"sudo dkms install --force -m {self.PACKAGE_NAME} -v {self.PACKAGE_VERSION}"
+        installed, _ = self.run_command(
+            [
+                "sudo",
+                "dkms",
+                "install",
+                "--force",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+            ]
+        )
+        return built and installed
+
+    def export_dkms_modules(self, tarball, kernel):
+        """Save the built modules to the DKMS cache with dkms mktarball."""
+        logging.info("Saving the built modules to the DKMS cache...")
+        exported, _ = self.run_command(
+            [
+                "sudo",
+                "dkms",
+                "mktarball",
+                "--binaries-only",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+                "-k",
+                kernel,
+            ]
         )
+        tarballs = glob(
+            f"/var/lib/dkms/{self.PACKAGE_NAME}/{self.PACKAGE_VERSION}/tarball/*kernel{kernel}*.dkms.tar.gz"
+        )
+        if not exported or not tarballs:
+            logging.error("Failed to export the built modules from DKMS.")
+            return
+        makedirs(self.DKMS_CACHE_DIR, exist_ok=True)
+        copyfile(max(tarballs, key=path.getmtime), tarball)
+
+    def dkms_major_version(self):
+        """Return the major version of dkms, or None if it cannot be read."""
+        result = run(["dkms", "--version"], stdout=PIPE, stderr=self.hide, text=True)
+        match = re.search(r"(\d+)\.", result.stdout or "")
+        return int(match.group(1)) if result.returncode == 0 and match else None
+
+    def install_cached_dkms_modules(self, tarball, kernel):
+        """Install modules built earlier for this kernel with dkms ldtarball."""
+        logging.info(f"Installing prebuilt modules from {tarball}...")
+        # dkms 3 takes the tarball as a positional argument, 2.x only --archive.
+        if self.dkms_major_version() == 2:
+            ldtarball = ["sudo", "dkms", "ldtarball", f"--archive={tarball}"]
+        else:
+            ldtarball = ["sudo", "dkms", "ldtarball", tarball]
+        loaded, _ = self.run_command(ldtarball + ["--force"])
+        installed, _ = self.run_command(
+            [
+                "sudo",
+                "dkms",
+                "install",
+                "--force",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+                "-k",
+                kernel,
+            ]
+        )
+        return loaded and installed
 
-        logging.info("Running vmware-modconfig to install all modules...")
-        self.run_command("sudo vmware-modconfig --console --install-all")
+    def install_vmware_modules(self):
+        """Install VMware modules."""
+        dest_dir = "/usr/lib/vmware/modules/source/"
+        folders_to_copy = ["vmmon-only", "vmnet-only"]
 
-        chdir("..")  # Return to previous directory
+        # Steps run on worker threads, so nothing here changes the process
+        # working directory; all paths are absolute.
+        logging.info("Copying vmmon and vmnet folders...")
+
+        for folder in folders_to_copy:
+            src_folder = path.join(self.SOURCE_DIR, folder)
+            dest_folder = path.join(dest_dir, folder)
+
+            if not path.exists(dest_folder):
+                self.run_command(["sudo", "mkdir", "-p", dest_folder])
+
+            logging.info(f"Copying {src_folder} to {dest_folder}...")
+            self.run_command(["sudo", "cp", "-r", src_folder, dest_folder])
+
+        logging.info("Folders copied successfully.")
+
+        kernel = self._get_kernel_version()
+        tarball = self.dkms_tarball_path(kernel)
+        from_cache = path.exists(tarball) and self.install_cached_dkms_modules(
+            tarball, kernel
+        )
+        if from_cache:
+            # The cached modules are already built and installed for this
+            # kernel, so they only need to be loaded.
+            logging.info("Loading the vmmon and vmnet modules...")
+            installed, _ = self.run_command(["sudo", "depmod", "-a"])
+            configured, _ = self.run_command(["sudo", "modprobe", "vmmon", "vmnet"])
+        else:
+            if path.exists(tarball):
+                logging.info("Cached modules could not be installed. Building them...")
+            installed = self.build_dkms_modules()
+            if installed:
+                self.export_dkms_modules(tarball, kernel)
+
+            logging.info("Running vmware-modconfig to install all modules...")
+            configured, _ = self.run_command(
+                ["sudo", "vmware-modconfig", "--console", "--install-all"]
+            )
+
+        return installed and configured
 
     def copy_service_files(self):
         """Copy systemd service files for VMware."""
+        succeeded = True
         for filename in self.SERVICES:
-            self.run_command(
-                f"sudo cp {self.CACHE_DIR}/vmware_files/services/{filename} /etc/systemd/system/{filename}"
+            copied, _ = self.run_command(
+                [
+                    "sudo",
+                    "cp",
+                    f"{self.CACHE_DIR}/vmware_files/services/{filename}",
+                    f"/etc/systemd/system/{filename}",
+                ]
             )
+            succeeded = succeeded and copied
             logging.info(f"Copied {filename}.")
 
         # Reload systemd daemon to apply changes
-        self.run_command("sudo systemctl daemon-reload")
+        self.run_command(["sudo", "systemctl", "daemon-reload"])
+        return succeeded
 
     def install_dependencies(self):
         """Install necessary dependencies for VMware."""
         logging.info("Installing dependencies...")
-        self.run_command(
-            f"sudo {self.PACKAGE_MANAGER} install -y {' '.join(self.DEPENDENCIES)}"
+        succeeded, _ = self.run_command(
+            ["sudo", self.PACKAGE_MANAGER, "install", "-y"] + self.DEPENDENCIES
         )
+        return succeeded
 
-    def install_vmware(self):
-        """Perform the full VMware installation."""
-
-        logging.info("\nStep 1: Installing necessary dependencies...")
-        self.install_dependencies()
-
-        logging.info("\nStep 2: Clone the required repositories...")
+    def clone_repositories(self):
+        """Download the host modules and the DKMS files repositories."""
         logging.info(f"Cloning {self.PACKAGE_NAME} repository...")
-        self.download_and_extract_zip(
+        host_modules = self.download_and_extract_zip(
             repo_url=self.GITHUB_HOST_MODULES_REPO_URL,
             branch=self.GITHUB_HOST_MODULES_BRANCH,
             extract_to=self.CACHE_DIR,
         )
 
         logging.info("Getting the DKMS modules")
-        self.download_and_extract_zip(
+        dkms_files = self.download_and_extract_zip(
             repo_url=self.GITHUB_REPO_URL,
             branch=self.GITHUB_BRANCH,
             folder_path="vmware_files",
             extract_to=self.CACHE_DIR,
         )
+        return host_modules and dkms_files
 
-        logging.info(
-            "\nStep 3: Downloading the VMware Workstation installer and components..."
-        )
-        makedirs(self.CACHE_DIR, exist_ok=True)
-        self.download_file(self.BUNDLE_URL, self.BUNDLE_FILENAME)
-        for url, filename in zip(self.COMPONENT_URLS, self.COMPONENT_FILENAMES):
-            self.download_file(url, filename)
-
-        logging.info("\nStep 4: Extracting the bundle file...")
-        self.run_command(
-            f"tar -xf {path.join(self.CACHE_DIR, self.BUNDLE_FILENAME)} -C {self.CACHE_DIR}"
-        )
-
-        makedirs(self.EXTRACTED_DIR, exist_ok=True)
-        for filename in self.COMPONENT_FILENAMES:
-            self.extract_tar(filename)
-
-        logging.info("\nStep 5: Making the installer executable...")
+    def run_installer(self):
+        """Run the VMware Workstation installer with the extracted components."""
         bundle_installer = (
             f"VMware-Workstation-{self.PKGVER}-{self.BUILDVER}.{self.CARCH}.bundle"
         )
-        self.run_command(f"chmod +x {path.join(self.CACHE_DIR, bundle_installer)}")
+        self.run_command(["chmod", "+x", path.join(self.CACHE_DIR, bundle_installer)])
 
-        logging.info(
-            "\nStep 6: Running the VMware Workstation installer with extracted components..."
-        )
         extracted_components = [
             path.join(self.EXTRACTED_DIR, filename)
             for filename in listdir(self.EXTRACTED_DIR)
         ]
-        install_command = (
-            f"sudo {path.join(self.CACHE_DIR, bundle_installer)} --console --required --eulas-agreed "
-            + " ".join(
-                [
-                    f'--install-component "{path.abspath(filename)}"'
-                    for filename in extracted_components
-                ]
-            )
+        install_command = [
+            "sudo",
+            path.join(self.CACHE_DIR, bundle_installer),
+            "--console",
+            "--required",
+            "--eulas-agreed",
+        ]
+        for filename in extracted_components:
+            install_command += ["--install-component", path.abspath(filename)]
+        succeeded, _ = self.run_command(install_command)
+        return succeeded
+
+    def file_hash(self, file_path):
+        return file_sha256(file_path) if path.exists(file_path) else None
+
+    def dependencies_inputs(self):
+        return {
+            "package_manager": self.PACKAGE_MANAGER,
+            "dependencies": self.DEPENDENCIES,
+        }
+
+    def repositories_inputs(self):
+        cache = get_download_cache()
+        return {
+            "archives": [
+                cache.cached_sha256(self.archive_url(repo_url, branch))
+                for repo_url, branch in (
+                    (
+                        self.GITHUB_HOST_MODULES_REPO_URL,
+                        self.GITHUB_HOST_MODULES_BRANCH,
+                    ),
+                    (self.GITHUB_REPO_URL, self.GITHUB_BRANCH),
+                )
+            ],
+            "extracted": path.isdir(self.SOURCE_DIR)
+            and path.isdir(path.join(self.CACHE_DIR, "vmware_files")),
+        }
+
+    def downloads_inputs(self):
+        cache = get_download_cache()
+        urls = [self.BUNDLE_URL] + self.COMPONENT_URLS
+        return {
+            "versions": [self.PKGVER, self.BUILDVER, self.TOOLS_VERSION],
+            "archives": [cache.cached_sha256(url) for url in urls],
+            "components": (
+                sorted(listdir(self.EXTRACTED_DIR))
+                if path.isdir(self.EXTRACTED_DIR)
+                else []
+            ),
+        }
+
+    def installer_inputs(self):
+        return {
+            "versions": [self.PKGVER, self.BUILDVER, self.TOOLS_VERSION],
+            "bundle": get_download_cache().cached_sha256(self.BUNDLE_URL),
+            "installed": path.exists("/usr/bin/vmware"),
+        }
+
+    def dkms_build_inputs(self):
+        """Return the sources and patch set the kernel modules are built from."""
+        dkms_files = path.join(self.CACHE_DIR, "vmware_files", "DKMS_files")
+        return {
+            "package_version": self.PACKAGE_VERSION,
+            "host_modules": get_download_cache().cached_sha256(
+                self.archive_url(
+                    self.GITHUB_HOST_MODULES_REPO_URL, self.GITHUB_HOST_MODULES_BRANCH
+                )
+            ),
+            "dkms_files": {
+                filename: self.file_hash(path.join(dkms_files, filename))
+                for filename in ("Makefile", "dkms.conf", "vmmon.patch", "vmnet.patch")
+            },
+        }
+
+    def kernel_modules_inputs(self):
+        return dict(self.dkms_build_inputs(), kernel=self._get_kernel_version())
+
+    def services_inputs(self):
+        return {
+            filename: [
+                self.file_hash(
+                    path.join(self.CACHE_DIR, "vmware_files", "services", filename)
+                ),
+                path.exists(f"/etc/systemd/system/{filename}"),
+            ]
+            for filename in sorted(self.SERVICES)
+        }
+
+    def install_vmware(self):
+        """Perform the full VMware installation."""
+
+        logging.info("\nStep 1: Installing necessary dependencies...")
+        self.manifest.run_step(
+            "dependencies", self.dependencies_inputs, self.install_dependencies
+        )
+
+        logging.info("\nStep 2: Clone the required repositories...")
+        self.manifest.run_step(
+            "repositories", self.repositories_inputs, self.clone_repositories
+        )
+
+        logging.info(
+            "\nStep 3: Downloading and extracting the VMware Workstation installer and components..."
+        )
+        makedirs(self.CACHE_DIR, exist_ok=True)
+        self.manifest.run_step(
+            "downloads", self.downloads_inputs, self.download_and_extract_all
+        )
+
+        logging.info(
+            "\nStep 4: Running the VMware Workstation installer with extracted components..."
         )
-        self.run_command(install_command)
+        self.manifest.run_step("installer", self.installer_inputs, self.run_installer)
 
-        logging.info("\nStep 7: Compiling kernel modules...")
-        self.install_vmware_modules()
+        logging.info("\nStep 5: Compiling kernel modules...")
+        self.manifest.run_step(
+            "kernel_modules", self.kernel_modules_inputs, self.install_vmware_modules
+        )
 
-        logging.info("\nStep 8: Creating systemd service files...")
-        self.copy_service_files()
+        logging.info("\nStep 6: Creating systemd service files...")
+        self.manifest.run_step(
+            "services", self.services_inputs, self.copy_service_files
+        )
 
-        logging.info("\nStep 9: Set up the network adapters...")
-        self.run_command("sudo chmod a+rw /dev/vmnet*")
+        logging.info("\nStep 7: Set up the network adapters...")
+        vmnet_devices = glob("/dev/vmnet*")
+        if vmnet_devices:
+            self.run_command(["sudo", "chmod", "a+rw"] + vmnet_devices)
 
         logging.info(
             f"VMware installation and setup on {self.linux_distro} is complete."
@@ -364,28 +681,39 @@ class VMwareInstaller:
         logging.info("\nStep 1: Stopping and disabling VMware services...")
         vmware_service = ["vmware.service"]
         for service in vmware_service:
-            self.run_command(f"sudo systemctl stop {service}")
-            self.run_command(f"sudo systemctl disable {service}")
+            self.run_command(["sudo", "systemctl", "stop", service])
+            self.run_command(["sudo", "systemctl", "disable", service])
 
         logging.info("\nStep 2: Removing systemd service files...")
 
         for service in self.SERVICES:
             service_file = f"/etc/systemd/system/{service}"
             if path.exists(service_file):
-                self.run_command(f"sudo rm {service_file}")
+                self.run_command(["sudo", "rm", service_file])
 
         logging.info("\nStep 3: Removing VMware modules from DKMS...")
         self.run_command(
-            f"sudo dkms remove -m {self.PACKAGE_NAME} -v {self.PACKAGE_VERSION} --all"
+            [
+                "sudo",
+                "dkms",
+                "remove",
+                "-m",
+                self.PACKAGE_NAME,
+                "-v",
+                self.PACKAGE_VERSION,
+                "--all",
+            ]
         )
 
         logging.info("\nStep 4: Running the uninstallation script...")
         uninstall_script = "/usr/bin/vmware-installer"
         if path.exists(uninstall_script):
             self.run_command(
-                f'echo "yes" | sudo {uninstall_script} --uninstall-product vmware-workstation'
+                ["sudo", uninstall_script, "--uninstall-product", "vmware-workstation"],
+                input="yes\n",
             )
 
         logging.info("\nStep 5: Removing extracted components directory...")
         if path.exists(self.EXTRACTED_DIR):
-            self.run_command(f"sudo rm -rf {self.EXTRACTED_DIR}")
+            self.run_command(["sudo", "rm", "-rf", self.EXTRACTED_DIR])
+        self.manifest.clear()
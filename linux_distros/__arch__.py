@@ -1,43 +1,165 @@
-from subprocess import run, PIPE, CalledProcessError
+from subprocess import CalledProcessError
 from os import devnull, getenv, path
-from time import sleep
 
-
-def arch_package_manager(packages, output, action, dry_run):
+from functions.__artifact_prefetcher__ import artifact_urls, get_artifact_prefetcher
+from functions.__aur_builder__ import get_aur_builder
+from functions.__command_runner__ import run
+from functions.__flatpak__ import (
+    add_flathub_remote,
+    flatpak_transaction,
+    get_flatpak_state,
+)
+from functions.__installed_packages__ import get_installed_snapshot
+from functions.__pauses__ import pause
+from functions.__plan_file__ import plan_artifacts, resolve_plan
+from functions.__transaction_planner__ import plan_transactions, run_transaction_plan
+
+# AUR packages are batched too, so that they are built in parallel and
+# installed together.
+BATCHABLE_TYPES = {"package", "AUR-package", "package-flatpak"}
+
+
+def arch_package_manager(bundles, output, action, dry_run, plan_file=None):
     hide = open(devnull, "w") if not output else None
 
-    for package in packages:
-        name = package.get("name", "")
-        check_value = package.get("check_value", "")
-        package_type = package.get("type", "")
-        check_script = package.get("check_script", [])
+    if plan_file:
+        plan = plan_file["steps"]
+    else:
+        plan = plan_transactions(bundles, BATCHABLE_TYPES, refresh=False)
+    if action == "install" and not dry_run:
+        get_artifact_prefetcher().prefetch(
+            plan_artifacts(plan_file)
+            if plan_file
+            else artifact_urls(plan, get_installed_snapshot("arch"))
+        )
+
+    run_transaction_plan(
+        plan,
+        lambda package: handle_package(package, action, dry_run, hide),
+        lambda packages: handle_package_transaction(packages, action, dry_run, hide),
+        # pacman -S resolves against the synced databases as they are; a
+        # separate -Sy before it would be a partial upgrade, so the plan has
+        # no refresh steps. Plan files written before that may still have them.
+        None,
+        run_id=None if dry_run else f"arch {action}",
+    )
+
+
+def arch_plan(bundles, action):
+    """Resolve bundles against this system into the steps and artifacts of a plan."""
+    installed_packages = get_installed_snapshot("arch")
+    plan = resolve_plan(
+        plan_transactions(bundles, BATCHABLE_TYPES, refresh=False),
+        action,
+        installed_packages,
+    )
+    if action != "install":
+        return plan, []
+    return plan, artifact_urls(plan, installed_packages)
 
-        try:
-            if package_type in {"package", "AUR-package", "local-package"}:
-                handle_standard_package(
-                    check_value, name, action, dry_run, package, hide
-                )
 
-            elif package_type in {"service", "group"}:
-                handle_service_or_group(name, action, dry_run, package, hide)
+def handle_package(package, action, dry_run, hide):
+    name = package.get("name", "")
+    check_value = package.get("check_value", "")
+    package_type = package.get("type", "")
+    check_script = package.get("check_script", [])
+
+    try:
+        if package_type in {"package", "AUR-package", "local-package"}:
+            handle_standard_package(
+                check_value, name, action, dry_run, package, hide
+            )
 
-            elif package_type == "get-keys":
-                handle_repo_keys(check_script, name, action, dry_run, package, hide)
+        elif package_type in {"service", "group"}:
+            handle_service_or_group(name, action, dry_run, package, hide)
 
-            elif package_type == "package-flatpak":
-                handle_flatpak_package(
-                    check_value, name, action, dry_run, package, hide
-                )
+        elif package_type == "get-keys":
+            handle_repo_keys(check_script, name, action, dry_run, package, hide)
 
-        except CalledProcessError as e:
-            handle_error(e, name, action, package, dry_run, hide)
+        elif package_type == "package-flatpak":
+            handle_flatpak_package(
+                check_value, name, action, dry_run, package, hide
+            )
 
+    except CalledProcessError as e:
+        handle_error(e, name, action, package, dry_run, hide)
 
-def handle_standard_package(check_value, name, action, dry_run, package, hide):
-    packages_to_check = check_value.split()
-    result = run(["pacman", "-Q"] + packages_to_check, stdout=PIPE, stderr=PIPE)
 
-    if "error" not in result.stderr.decode("utf-8").lower():
+def handle_package_transaction(packages, action, dry_run, hide):
+    """Install or remove several entries of one type with a single pacman call.
+
+    "AUR-package" entries to install are built first, all with one pacman -U,
+    and "package-flatpak" entries are changed with one flatpak call.
+    """
+    if packages[0].get("type") == "package-flatpak":
+        failed = flatpak_transaction(packages, action, dry_run, hide)
+        if failed:
+            print("Batched transaction failed. Retrying the packages one by one...")
+        for package in failed:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
+        return
+
+    installed_packages = get_installed_snapshot("arch")
+    pending = []
+
+    for package in packages:
+        name = package.get("name", "")
+        missing = installed_packages.missing(package.get("check_value", "").split())
+        if action == "install":
+            if missing:
+                print(f"{name} not installed. Installing...")
+                pending.append(package)
+            else:
+                print(f"{name} was installed. Skipping...")
+        elif action == "remove":
+            if missing:
+                print(f"{name} not installed. Skipping...")
+            elif package.get("remove_value", ""):
+                print(f"{name} removing...")
+                pending.append(package)
+            else:
+                print(f"{name} is kept. Skipping...")
+
+    value_key = "install_value" if action == "install" else "remove_value"
+    package_names = [
+        package_name
+        for package in pending
+        for package_name in package.get(value_key, "").split()
+    ]
+    if dry_run or not package_names:
+        return
+
+    if action == "install" and pending[0].get("type") == "AUR-package":
+        failed = get_aur_builder().install(package_names, hide)
+        for name in failed:
+            print(f"{name} could not be built or installed.")
+        if failed:
+            pause(3000)
+        installed_packages.invalidate()
+        return
+
+    pacman_action = "-S" if action == "install" else "-R"
+    result = run(
+        ["sudo", "pacman", pacman_action] + package_names + ["--noconfirm"],
+        stderr=hide,
+        stdout=hide,
+    )
+    installed_packages.invalidate()
+
+    if result.returncode != 0 and len(pending) > 1:
+        print("Batched transaction failed. Retrying the packages one by one...")
+        for package in pending:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
+
+
+def handle_standard_package(check_value, name, action, dry_run, package, hide):
+    if not get_installed_snapshot("arch").missing(check_value.split()):
         if action == "install":
             print(f"{name} was installed. Skipping...")
         elif action == "remove":
@@ -88,9 +210,7 @@ def handle_repo_keys(check_script, name, action, dry_run, package, hide):
 
 
 def handle_flatpak_package(check_value, name, action, dry_run, package, hide):
-    result = run(["flatpak", "list"], stdout=PIPE, stderr=PIPE)
-
-    if check_value not in result.stdout.decode("utf-8"):
+    if get_flatpak_state().missing([check_value]):
         if action == "install":
             print(f"{name} not installed. Installing...")
             if not dry_run:
@@ -122,7 +242,6 @@ def handle_error(e, name, action, package, dry_run, hide):
 
 def package_installer(package, hide):
     current_user = getenv("USER")
-    target_directory = f"/home/{current_user}/"
     package_type = package.get("type", "")
     install_value = package.get("install_value", "")
 
@@ -132,21 +251,24 @@ def package_installer(package, hide):
                 ["sudo", "pacman", "-S", install_value, "--noconfirm"],
                 stderr=hide,
                 stdout=hide,
+                check=True,
             )
 
         elif package_type == "local-package":
-            local_package_installer(install_value, target_directory, hide)
+            local_package_installer(install_value, package.get("sha256"), hide)
 
         elif package_type == "service":
             run(
                 ["sudo", "systemctl", "restart", install_value],
                 stderr=hide,
                 stdout=hide,
+                check=True,
             )
             run(
                 ["sudo", "systemctl", "enable", install_value],
                 stderr=hide,
                 stdout=hide,
+                check=True,
             )
 
         elif package_type == "group":
@@ -154,83 +276,45 @@ def package_installer(package, hide):
                 ["sudo", "usermod", "-aG", install_value, current_user],
                 stderr=hide,
                 stdout=hide,
+                check=True,
             )
 
         elif package_type == "repo-flathub":
-            run(
-                [
-                    "sudo",
-                    "flatpak",
-                    "remote-add",
-                    "--if-not-exists",
-                    "flathub",
-                    install_value,
-                ],
-                stderr=hide,
-                stdout=hide,
-            )
+            add_flathub_remote(install_value, hide)
 
         elif package_type == "package-flatpak":
             run(
                 ["sudo", "flatpak", "install", "-y", install_value],
                 stderr=hide,
                 stdout=hide,
+                check=True,
             )
+            get_flatpak_state().invalidate()
 
         elif package_type == "AUR-package":
-            handle_aur_package(install_value, target_directory, hide)
+            failed = get_aur_builder().install(install_value.split(), hide)
+            for name in failed:
+                print(f"{name} could not be built or installed.")
+            if failed:
+                pause(3000)
 
     except CalledProcessError as err:
         print(f"An error occurred: {err}")
-        sleep(10)
+        pause(3000)
 
-
-def local_package_installer(install_value, target_directory, hide):
-    run(
-        [
-            "wget",
-            "--progress=bar:force",
-            "-O",
-            "local.package.pkg.tar.zst",
-            install_value,
-        ],
-        cwd=target_directory,
-        stderr=hide,
-        stdout=hide,
-    )
-    run(
-        ["sudo", "pacman", "-U", "local.package.pkg.tar.zst", "--noconfirm"],
-        cwd=target_directory,
-        stderr=hide,
-        stdout=hide,
-    )
-    run(
-        ["sudo", "rm", "-f", "local.package.pkg.tar.zst"],
-        cwd=target_directory,
-        stderr=hide,
-        stdout=hide,
-    )
+    if package_type not in {"service", "group", "repo-flathub"}:
+        get_installed_snapshot("arch").invalidate()
 
 
-def handle_aur_package(install_value, target_directory, hide):
-    repository_directory = f"{target_directory}/{install_value}"
+def local_package_installer(install_value, expected_sha256, hide):
+    local_path = get_artifact_prefetcher().fetch(install_value, expected_sha256)
+    if not local_path:
+        return
     run(
-        ["git", "clone", f"https://aur.archlinux.org/{install_value}.git"],
-        cwd=target_directory,
-    )
-    sleep(10)
-    run(
-        ["makepkg", "-si", "--noconfirm"],
-        cwd=repository_directory,
-        stderr=hide,
-        stdout=hide,
-    )
-    sleep(10)
-    run(
-        ["sudo", "rm", "-rf", install_value],
-        cwd=target_directory,
+        ["sudo", "pacman", "-U", local_path, "--noconfirm"],
         stderr=hide,
         stdout=hide,
+        check=True,
     )
 
 
@@ -252,6 +336,9 @@ def package_remover(package, hide):
                 stderr=hide,
                 stdout=hide,
             )
+            get_flatpak_state().invalidate()
 
     except CalledProcessError as err:
         print(f"An error occurred: {err}")
+
+    get_installed_snapshot("arch").invalidate()
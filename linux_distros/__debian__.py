@@ -1,53 +1,153 @@
-from subprocess import run, PIPE, CalledProcessError
+from subprocess import CalledProcessError
 from os import path, devnull, getenv
 
+from functions.__artifact_prefetcher__ import artifact_urls, get_artifact_prefetcher
+from functions.__command_runner__ import command_argv, run
+from functions.__download_cache__ import fetch_script_download
+from functions.__flatpak__ import (
+    add_flathub_remote,
+    flatpak_transaction,
+    get_flatpak_state,
+)
+from functions.__installed_packages__ import get_installed_snapshot
+from functions.__metadata_refresh__ import (
+    get_metadata_refresher,
+    is_metadata_refresh_command,
+)
+from functions.__plan_file__ import plan_artifacts, resolve_plan
 from functions.__special_install_selector__ import SelectSpecialInstaller
+from functions.__step_dedup__ import get_step_deduplicator
+from functions.__transaction_planner__ import plan_transactions, run_transaction_plan
 
 
-def debian_package_manager(packages, output, action, dry_run):
+def debian_package_manager(bundles, output, action, dry_run, plan_file=None):
     hide = open(devnull, "w") if not output else None
 
-    # Update package list
-    if not dry_run:
-        run(["sudo", "apt", "update"], stderr=hide, stdout=hide)
+    plan = plan_file["steps"] if plan_file else plan_transactions(bundles)
+    if action == "install" and not dry_run:
+        get_artifact_prefetcher().prefetch(
+            plan_artifacts(plan_file)
+            if plan_file
+            else artifact_urls(plan, get_installed_snapshot("debian"))
+        )
+
+    run_transaction_plan(
+        plan,
+        lambda package: handle_package(package, action, dry_run, hide),
+        lambda packages: handle_package_transaction(packages, action, dry_run, hide),
+        lambda: refresh_metadata(action, dry_run, hide),
+        run_id=None if dry_run else f"debian {action}",
+    )
+
+
+def debian_plan(bundles, action):
+    """Resolve bundles against this system into the steps and artifacts of a plan."""
+    installed_packages = get_installed_snapshot("debian")
+    plan = resolve_plan(plan_transactions(bundles), action, installed_packages)
+    if action != "install":
+        return plan, []
+    return plan, artifact_urls(plan, installed_packages)
+
+
+def refresh_metadata(action, dry_run, hide):
+    if action == "install" and not dry_run:
+        get_metadata_refresher("debian").refresh(hide)
+
+
+def handle_package(package, action, dry_run, hide):
+    name = package.get("name", "")
+    check_value = package.get("check_value", "")
+    package_type = package.get("type", "")
+    check_script = package.get("check_script", [])
+
+    try:
+        if package_type in {"package", "url-package", "local-package"}:
+            handle_standard_package(package, action, dry_run, hide)
+        elif package_type == "special-package":
+            handle_special_package(package, action, dry_run, hide)
+        elif package_type == "remove-package":
+            handle_removable_package(package, action, dry_run, hide)
+        elif package_type == "get-keys":
+            handle_repo_keys(package, check_script, action, dry_run, hide)
+        elif package_type in {"service", "group"}:
+            handle_service_or_group(package, action, dry_run, hide)
+        elif package_type == "package-flatpak":
+            handle_flatpak_package(package, check_value, action, dry_run, hide)
+    except CalledProcessError as e:
+        handle_error(e, check_value, action, name, dry_run, package, hide)
+
+
+def handle_package_transaction(packages, action, dry_run, hide):
+    """Install or remove several "package" entries with a single apt call.
+
+    "package-flatpak" entries are installed or removed with one flatpak call.
+    """
+    if packages[0].get("type") == "package-flatpak":
+        failed = flatpak_transaction(packages, action, dry_run, hide)
+        if failed:
+            print("Batched transaction failed. Retrying the packages one by one...")
+        for package in failed:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
+        return
+
+    installed_packages = get_installed_snapshot("debian")
+    pending = []
 
     for package in packages:
         name = package.get("name", "")
-        check_value = package.get("check_value", "")
-        package_type = package.get("type", "")
-        check_script = package.get("check_script", [])
-
-        try:
-            if package_type in {"package", "url-package", "local-package"}:
-                handle_standard_package(package, action, dry_run, hide)
-            elif package_type == "special-package":
-                handle_special_package(package, action, dry_run, hide)
-            elif package_type == "remove-package":
-                handle_removable_package(package, action, dry_run, hide)
-            elif package_type == "get-keys":
-                handle_repo_keys(package, check_script, action, dry_run, hide)
-            elif package_type in {"service", "group"}:
-                handle_service_or_group(package, action, dry_run, hide)
-            elif package_type == "package-flatpak":
-                handle_flatpak_package(package, check_value, action, dry_run, hide)
-        except CalledProcessError as e:
-            handle_error(e, check_value, action, name, dry_run, package, hide)
+        missing = installed_packages.missing(package.get("check_value", "").split())
+        if action == "install":
+            if missing:
+                print(
+                    f"{name} not installed. {'Would install...' if dry_run else 'Installing...'}"
+                )
+                pending.append(package)
+            else:
+                print(f"{name} already installed. Skipping...")
+        elif action == "remove":
+            if missing:
+                print(f"{name} not installed. Skipping...")
+            elif package.get("remove_value", ""):
+                print(f"{name} {'Would remove...' if dry_run else 'Removing...'}")
+                pending.append(package)
+            else:
+                print(f"{name} is kept. Skipping...")
+
+    value_key = "install_value" if action == "install" else "remove_value"
+    package_names = [
+        package_name
+        for package in pending
+        for package_name in package.get(value_key, "").split()
+    ]
+    if dry_run or not package_names:
+        return
+
+    apt_action = "install" if action == "install" else "remove"
+    result = run(
+        ["sudo", "apt", apt_action, "-y"] + package_names,
+        stderr=hide,
+        stdout=hide,
+    )
+    installed_packages.invalidate()
+
+    if result.returncode != 0 and len(pending) > 1:
+        print("Batched transaction failed. Retrying the packages one by one...")
+        for package in pending:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
 
 
 def handle_standard_package(package, action, dry_run, hide):
     name = package.get("name", "")
     check_value = package.get("check_value", "")
-    packages_to_check = check_value.split()
-
-    result = run(
-        ["apt", "list", "--installed"] + packages_to_check,
-        stdout=PIPE,
-        stderr=PIPE,
+    not_installed_packages = get_installed_snapshot("debian").missing(
+        check_value.split()
     )
-    installed_packages = result.stdout.decode("utf-8")
-    not_installed_packages = [
-        package for package in packages_to_check if package not in installed_packages
-    ]
 
     if not_installed_packages:
         if action == "install":
@@ -72,18 +172,10 @@ def handle_removable_package(package, action, dry_run, hide):
     check_value = package.get("check_value", "")
     packages_to_check = check_value.split()
 
-    result = run(
-        ["apt", "list", "--installed"] + packages_to_check,
-        stdout=PIPE,
-        stderr=PIPE,
+    not_installed_packages = get_installed_snapshot("debian").missing(
+        packages_to_check
     )
 
-    not_installed_packages = [
-        package
-        for package in packages_to_check
-        if package not in result.stdout.decode("utf-8")
-    ]
-
     if not_installed_packages:
         if action == "install":
             print(f"{name} {'Would remove...' if dry_run else 'Removing...'}")
@@ -128,9 +220,7 @@ def handle_service_or_group(package, action, dry_run, hide):
 
 
 def handle_flatpak_package(package, check_value, action, dry_run, hide):
-    result = run(["flatpak", "list"], stdout=PIPE, stderr=PIPE)
-
-    if check_value not in result.stdout.decode("utf-8"):
+    if get_flatpak_state().missing([check_value]):
         if action == "install":
             print(f"{package['name']} not installed. Installing...")
             if not dry_run:
@@ -161,7 +251,6 @@ def handle_error(e, check_value, action, name, dry_run, package, hide):
 
 def package_installer(package, hide):
     current_user = getenv("USER")
-    target_directory = f"/home/{current_user}/"
     package_type = package.get("type", "")
     install_value = package.get("install_value", "")
 
@@ -176,14 +265,27 @@ def package_installer(package, hide):
 
         elif package_type == "get-keys":
             install_script = package.get("install_script", [])
-            for command in install_script:
+            for index, command in enumerate(install_script):
+                if is_metadata_refresh_command(command):
+                    # A trailing refresh is left to the planned refresh step.
+                    refresher = get_metadata_refresher("debian")
+                    if index == len(install_script) - 1 or not refresher.refresh(hide):
+                        get_step_deduplicator().record(command)
+                    continue
+                if fetch_script_download(command):
+                    continue
                 try:
-                    run(command, shell=True, stderr=hide, stdout=hide)
+                    get_step_deduplicator().run_script_command(
+                        command,
+                        lambda line: run(
+                            command_argv(line), stderr=hide, stdout=hide
+                        ),
+                    )
                 except CalledProcessError as err:
                     print(f"An error occurred: {err}")
 
         elif package_type == "local-package":
-            handle_local_package(install_value, target_directory, hide)
+            handle_local_package(install_value, package.get("sha256"), hide)
 
         elif package_type == "service":
             run(
@@ -205,18 +307,7 @@ def package_installer(package, hide):
             )
 
         elif package_type == "repo-flathub":
-            run(
-                [
-                    "sudo",
-                    "flatpak",
-                    "remote-add",
-                    "--if-not-exists",
-                    "flathub",
-                    install_value,
-                ],
-                stderr=hide,
-                stdout=hide,
-            )
+            add_flathub_remote(install_value, hide)
 
         elif package_type == "package-flatpak":
             run(
@@ -224,10 +315,14 @@ def package_installer(package, hide):
                 stderr=hide,
                 stdout=hide,
             )
+            get_flatpak_state().invalidate()
 
     except CalledProcessError as err:
         print(f"An error occurred while installing {package.get('name', '')}: {err}")
 
+    if package_type not in {"service", "group", "repo-flathub"}:
+        get_installed_snapshot("debian").invalidate()
+
 
 def handle_special_package(package, action, dry_run, hide):
     name = package.get("name", "")
@@ -261,12 +356,13 @@ def package_remover(package, hide):
                 stderr=hide,
                 stdout=hide,
             )
+            get_flatpak_state().invalidate()
 
         elif package_type == "get-keys":
             remove_script = package.get("remove_script", [])
             for command in remove_script:
                 try:
-                    run(command, shell=True, stderr=hide, stdout=hide)
+                    run(command_argv(command), stderr=hide, stdout=hide)
                 except CalledProcessError as err:
                     print(
                         f"An error occurred while removing {package.get('name', '')}: {err}"
@@ -275,12 +371,13 @@ def package_remover(package, hide):
     except CalledProcessError as err:
         print(f"An error occurred while removing {package.get('name', '')}: {err}")
 
+    get_installed_snapshot("debian").invalidate()
 
-def handle_local_package(install_value, target_directory, hide):
-    local_path = path.join(target_directory, "local.package.deb")
-    run(
-        ["wget", "--progress=bar:force", "-O", local_path, install_value],
-    )
+
+def handle_local_package(install_value, expected_sha256, hide):
+    local_path = get_artifact_prefetcher().fetch(install_value, expected_sha256)
+    if not local_path:
+        return
     run(
         ["sudo", "dpkg", "-i", local_path],
         stderr=hide,
@@ -291,9 +388,3 @@ def handle_local_package(install_value, target_directory, hide):
         stderr=hide,
         stdout=hide,
     )
-    run(
-        ["sudo", "rm", "-f", local_path],
-        stderr=hide,
-        stdout=hide,
-    )
-
@@ -1,46 +1,149 @@
-from subprocess import run, PIPE, CalledProcessError, check_output
+from subprocess import CalledProcessError
 from os import path, getenv
+from functions.__artifact_prefetcher__ import artifact_urls, get_artifact_prefetcher
+from functions.__command_runner__ import command_argv, run
+from functions.__download_cache__ import fetch_script_download
+from functions.__flatpak__ import (
+    add_flathub_remote,
+    flatpak_transaction,
+    get_flatpak_state,
+)
+from functions.__installed_packages__ import get_installed_snapshot
+from functions.__metadata_refresh__ import (
+    get_metadata_refresher,
+    is_metadata_refresh_command,
+)
+from functions.__plan_file__ import plan_artifacts, resolve_plan
 from functions.__special_install_selector__ import SelectSpecialInstaller
+from functions.__step_dedup__ import get_step_deduplicator
+from functions.__transaction_planner__ import plan_transactions, run_transaction_plan
 
 
-def fedora_package_manager(packages, output, action, dry_run):
+def fedora_package_manager(bundles, output, action, dry_run, plan_file=None):
     with open("/dev/null", "w") as devnull:
         hide = None if output else devnull
 
-        for package in packages:
-            name = package.get("name", "")
-            check_value = package.get("check_value", "")
-            package_type = package.get("type", "")
-            check_script = package.get("check_script", [])
-
-            try:
-                if package_type in {"package", "url-package", "local-package"}:
-                    handle_standard_package(package, check_value, action, dry_run, hide)
-                elif package_type == "special-package":
-                    handle_special_package(package, action, dry_run, hide)
-                elif package_type == "remove-package":
-                    handle_removable_package(
-                        package, check_value, action, dry_run, hide
-                    )
-                elif package_type == "get-keys":
-                    handle_repo_keys(package, check_script, action, dry_run, hide)
-                elif package_type in {"service", "group"}:
-                    handle_service_or_group(package, action, dry_run, hide)
-                elif package_type == "package-flatpak":
-                    handle_flatpak_package(package, check_value, action, dry_run, hide)
-
-            except CalledProcessError as e:
-                handle_error(e, check_value, action, name, dry_run, package, hide)
+        plan = plan_file["steps"] if plan_file else plan_transactions(bundles)
+        if action == "install" and not dry_run:
+            get_artifact_prefetcher().prefetch(
+                plan_artifacts(plan_file)
+                if plan_file
+                else artifact_urls(
+                    plan, get_installed_snapshot("fedora"), replace_fedora_version
+                )
+            )
 
+        run_transaction_plan(
+            plan,
+            lambda package: handle_package(package, action, dry_run, hide),
+            lambda packages: handle_package_transaction(packages, action, dry_run, hide),
+            lambda: refresh_metadata(action, dry_run, hide),
+            run_id=None if dry_run else f"fedora {action}",
+        )
 
-def handle_standard_package(package, check_value, action, dry_run, hide):
+
+def fedora_plan(bundles, action):
+    """Resolve bundles against this system into the steps and artifacts of a plan."""
+    installed_packages = get_installed_snapshot("fedora")
+    plan = resolve_plan(plan_transactions(bundles), action, installed_packages)
+    if action != "install":
+        return plan, []
+    return plan, artifact_urls(plan, installed_packages, replace_fedora_version)
+
+
+def refresh_metadata(action, dry_run, hide):
+    if action == "install" and not dry_run:
+        get_metadata_refresher("fedora").refresh(hide)
+
+
+def handle_package(package, action, dry_run, hide):
+    name = package.get("name", "")
+    check_value = package.get("check_value", "")
+    package_type = package.get("type", "")
+    check_script = package.get("check_script", [])
+
+    try:
+        if package_type in {"package", "url-package", "local-package"}:
+            handle_standard_package(package, check_value, action, dry_run, hide)
+        elif package_type == "special-package":
+            handle_special_package(package, action, dry_run, hide)
+        elif package_type == "remove-package":
+            handle_removable_package(package, check_value, action, dry_run, hide)
+        elif package_type == "get-keys":
+            handle_repo_keys(package, check_script, action, dry_run, hide)
+        elif package_type in {"service", "group"}:
+            handle_service_or_group(package, action, dry_run, hide)
+        elif package_type == "package-flatpak":
+            handle_flatpak_package(package, check_value, action, dry_run, hide)
+
+    except CalledProcessError as e:
+        handle_error(e, check_value, action, name, dry_run, package, hide)
+
+
+def handle_package_transaction(packages, action, dry_run, hide):
+    """Install or remove several "package" entries with a single dnf call.
+
+    "package-flatpak" entries are installed or removed with one flatpak call.
+    """
+    if packages[0].get("type") == "package-flatpak":
+        failed = flatpak_transaction(packages, action, dry_run, hide)
+        if failed:
+            print("Batched transaction failed. Retrying the packages one by one...")
+        for package in failed:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
+        return
+
+    installed_packages = get_installed_snapshot("fedora")
+    pending = []
+
+    for package in packages:
+        missing = installed_packages.missing(package.get("check_value", "").split())
+        if action == "install":
+            if missing:
+                print(f"{package['name']} not installed. Installing...")
+                pending.append(package)
+            else:
+                print(f"{package['name']} was installed. Skipping...")
+        elif action == "remove":
+            if missing:
+                print(f"{package['name']} not installed. Skipping...")
+            elif package.get("remove_value", ""):
+                print(f"{package['name']} removing...")
+                pending.append(package)
+            else:
+                print(f"{package['name']} is kept. Skipping...")
+
+    value_key = "install_value" if action == "install" else "remove_value"
+    package_names = [
+        package_name
+        for package in pending
+        for package_name in package.get(value_key, "").split()
+    ]
+    if dry_run or not package_names:
+        return
+
+    dnf_action = "install" if action == "install" else "remove"
     result = run(
-        ["dnf", "list", "installed"] + check_value.split(),
-        stdout=PIPE,
-        stderr=PIPE,
+        ["sudo", "dnf", dnf_action, "-y"] + package_names,
+        stderr=hide,
+        stdout=hide,
     )
+    installed_packages.invalidate()
+
+    if result.returncode != 0 and len(pending) > 1:
+        print("Batched transaction failed. Retrying the packages one by one...")
+        for package in pending:
+            if action == "install":
+                package_installer(package, hide)
+            else:
+                package_remover(package, hide)
 
-    if check_value not in result.stderr.decode("utf-8").lower():
+
+def handle_standard_package(package, check_value, action, dry_run, hide):
+    if get_installed_snapshot("fedora").missing(check_value.split()):
         if action == "install":
             print(f"{package['name']} not installed. Installing...")
             if not dry_run:
@@ -57,13 +160,7 @@ def handle_standard_package(package, check_value, action, dry_run, hide):
 
 
 def handle_removable_package(package, check_value, action, dry_run, hide):
-    result = run(
-        ["dnf", "list", "installed"] + check_value.split(),
-        stdout=PIPE,
-        stderr=PIPE,
-    )
-
-    if "error" not in result.stderr.decode("utf-8").lower():
+    if not get_installed_snapshot("fedora").missing(check_value.split()):
         if action == "install":
             print(f"{package['name']} removing...")
             if not dry_run:
@@ -104,9 +201,7 @@ def handle_service_or_group(package, action, dry_run, hide):
 
 
 def handle_flatpak_package(package, check_value, action, dry_run, hide):
-    result = run(["flatpak", "list"], stdout=PIPE, stderr=PIPE)
-
-    if check_value not in result.stdout.decode("utf-8"):
+    if get_flatpak_state().missing([check_value]):
         if action == "install":
             print(f"{package['name']} not installed. Installing...")
             if not dry_run:
@@ -137,7 +232,6 @@ def handle_error(e, check_value, action, name, dry_run, package, hide):
 
 def package_installer(package, hide):
     current_user = getenv("USER")
-    target_directory = f"/home/{current_user}/"
     package_type = package.get("type", "")
     install_value = package.get("install_value", "")
 
@@ -149,17 +243,36 @@ def package_installer(package, hide):
                 stdout=hide,
             )
         elif package_type == "get-keys":
-            for command in package.get("install_script", []):
-                run(command, shell=True, stderr=hide, stdout=hide)
+            install_script = package.get("install_script", [])
+            for index, command in enumerate(install_script):
+                if is_metadata_refresh_command(command):
+                    # A trailing refresh is left to the planned refresh step.
+                    refresher = get_metadata_refresher("fedora")
+                    if index == len(install_script) - 1 or not refresher.refresh(hide):
+                        get_step_deduplicator().record(command)
+                    continue
+                if fetch_script_download(command):
+                    continue
+                get_step_deduplicator().run_script_command(
+                    command,
+                    lambda line: run(
+                        command_argv(line), stderr=hide, stdout=hide
+                    ),
+                )
         elif package_type == "url-package":
             install_value = replace_fedora_version(install_value)
+            # dnf can still fetch the URL itself if the prefetch failed.
+            local_file = (
+                get_artifact_prefetcher().fetch(install_value, package.get("sha256"))
+                or install_value
+            )
             run(
-                ["sudo", "dnf", "install", "-y", install_value],
+                ["sudo", "dnf", "install", "-y", local_file],
                 stderr=hide,
                 stdout=hide,
             )
         elif package_type == "local-package":
-            handle_local_package(install_value, target_directory, hide)
+            handle_local_package(install_value, package.get("sha256"), hide)
         elif package_type == "service":
             run(
                 ["sudo", "systemctl", "restart", install_value],
@@ -178,27 +291,20 @@ def package_installer(package, hide):
                 stdout=hide,
             )
         elif package_type == "repo-flathub":
-            run(
-                [
-                    "sudo",
-                    "flatpak",
-                    "remote-add",
-                    "--if-not-exists",
-                    "flathub",
-                    install_value,
-                ],
-                stderr=hide,
-                stdout=hide,
-            )
+            add_flathub_remote(install_value, hide)
         elif package_type == "package-flatpak":
             run(
                 ["sudo", "flatpak", "install", "-y", install_value],
                 stderr=hide,
                 stdout=hide,
             )
+            get_flatpak_state().invalidate()
     except CalledProcessError as err:
         print(f"An error occurred: {err}")
 
+    if package_type not in {"service", "group", "repo-flathub"}:
+        get_installed_snapshot("fedora").invalidate()
+
 
 def handle_special_package(package, action, dry_run, hide):
     name = package.get("name", "")
@@ -230,28 +336,29 @@ def package_remover(package, hide):
                 stderr=hide,
                 stdout=hide,
             )
+            get_flatpak_state().invalidate()
         elif package_type == "get-keys":
             for command in package.get("remove_script", []):
-                run(command, shell=True, stderr=hide, stdout=hide)
+                run(command_argv(command), stderr=hide, stdout=hide)
     except CalledProcessError as err:
         print(f"An error occurred: {err}")
 
+    get_installed_snapshot("fedora").invalidate()
+
 
 def replace_fedora_version(value):
-    fedora_version = check_output(["rpm", "-E", "%fedora"], text=True).strip()
+    fedora_version = run(
+        ["rpm", "-E", "%fedora"], capture_output=True, text=True
+    ).stdout.strip()
     return value.replace("$(rpm -E %fedora)", fedora_version)
 
 
-def handle_local_package(install_value, target_directory, hide):
-    local_file = path.join(target_directory, "local.package.rpm")
-    run(
-        ["wget", "--progress=bar:force", "-O", local_file, install_value],
-        stderr=hide,
-        stdout=hide,
-    )
+def handle_local_package(install_value, expected_sha256, hide):
+    local_file = get_artifact_prefetcher().fetch(install_value, expected_sha256)
+    if not local_file:
+        return
     run(
         ["sudo", "dnf", "install", "-y", local_file],
         stderr=hide,
         stdout=hide,
     )
-    run(["sudo", "rm", "-f", local_file], stderr=hide, stdout=hide)
@@ -40,6 +40,63 @@ class ArgumentHandler:
             action="store_true",
             help="Refresh the JSON data regardless of file age",
         )
+        parser.add_argument(
+            "-b",
+            "--background-refresh",
+            action="store_true",
+            help="Use the cached JSON data right away and refresh it in the background",
+        )
+        parser.add_argument(
+            "--metadata-max-age",
+            type=int,
+            default=60,
+            metavar="MINUTES",
+            help="Skip the package manager metadata refresh if it is newer than this",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=4,
+            help="Maximum number of install steps to run at the same time",
+        )
+        parser.add_argument(
+            "--artifact-cache-size",
+            type=int,
+            default=5120,
+            metavar="MB",
+            help="Size budget of the downloaded artifact cache",
+        )
+        parser.add_argument(
+            "--privileged-helper",
+            action="store_true",
+            help="Ask for sudo once and run all privileged commands through one helper process",
+        )
+        parser.add_argument(
+            "--log-file",
+            metavar="FILE",
+            help="Append the output of every command to this file",
+        )
+        parser.add_argument(
+            "--no-pause",
+            action="store_true",
+            help="Do not pause after status and error messages",
+        )
+        parser.add_argument(
+            "--no-resume",
+            action="store_true",
+            help="Start over instead of resuming an interrupted run of the same packages",
+        )
+        parser.add_argument(
+            "--plan",
+            metavar="FILE",
+            help="Write the plan for the selected packages to this file instead of running it",
+        )
+        parser.add_argument(
+            "--apply",
+            metavar="FILE",
+            help="Run the plan in this file, made with --plan",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -78,6 +135,16 @@ class ArgumentHandler:
         print("Action: Install" if self.args.action == "install" else "Action: Remove")
         print("Selected Packages:", self.args.packages)
         print("Refresh JSON Data:", self.args.refresh)
+        print("Background Refresh:", self.args.background_refresh)
+        print("Metadata Max Age (minutes):", self.args.metadata_max_age)
+        print("Jobs:", self.args.jobs)
+        print("Artifact Cache Size (MB):", self.args.artifact_cache_size)
+        print("Privileged Helper:", self.args.privileged_helper)
+        print("Log File:", self.args.log_file)
+        print("No Pause:", self.args.no_pause)
+        print("No Resume:", self.args.no_resume)
+        print("Plan File:", self.args.plan)
+        print("Apply Plan File:", self.args.apply)
         print("Verbose Mode:", self.args.verbose)
         print("Dry Run:", self.args.dry_run)
         print("List Packages:", self.args.list)
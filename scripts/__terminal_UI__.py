@@ -8,7 +8,8 @@ from functions.__get_os_package_manager__ import (
     get_linux_package_manager,
     identify_distribution,
 )
-from functions.__get_packages_data__ import PackagesJSONHandler
+from functions.__get_packages_data__ import get_packages_catalog
+from functions.__pauses__ import pause
 
 OPTIONS_YES_NO = ["Yes", "No"]
 OPTIONS_INSTALL_REMOVE = ["install", "remove"]
@@ -17,10 +18,12 @@ DEFAULT_HEADER = "VCANDY"
 VERSION = "v2.2"
 MIN_LINES = 20
 MIN_COLS = 80
+CATALOG_POLL_MS = 500
 
 class PackageManagerApp:
-    def __init__(self, stdscr):
+    def __init__(self, stdscr, catalog=None):
         self.stdscr = stdscr
+        self.catalog = catalog or get_packages_catalog()
         self.height, self.width = self.stdscr.getmaxyx()
         self.selected_status_array = []
         self.use_dark_mode = True
@@ -132,7 +135,7 @@ class PackageManagerApp:
                     y, x + len(prompt_checking), " [OK]", color_pair | curses.A_BOLD
                 )
                 self.stdscr.refresh()
-                curses.napms(750)
+                pause(750)
                 return True
             else:
                 self.stdscr.addstr(
@@ -219,7 +222,7 @@ class PackageManagerApp:
         y = self.height // 2
         self.stdscr.addstr(y, x, error_message, curses.color_pair(2))
         self.stdscr.refresh()
-        curses.napms(3000)
+        pause(3000)
         sys.exit(0)
 
     def get_user_input_string(self, prompt, y, x):
@@ -344,7 +347,7 @@ class PackageManagerApp:
                         curses.color_pair(2) | curses.A_BOLD,
                     )
                     self.stdscr.refresh()
-                    curses.napms(1500)
+                    pause(1500)
                     sys.exit(0)
             elif actions == "remove":
                 return "remove"
@@ -444,15 +447,7 @@ class PackageManagerApp:
         return [False] * length
 
     def packages(self, linux_distro):
-        handler = PackagesJSONHandler()
-        instructions_data = handler.load_json_data()
-
-        if linux_distro in instructions_data:
-            package_list = instructions_data[linux_distro]
-            relevant_packages = [package.get("name", "") for package in package_list]
-            return relevant_packages
-        else:
-            return []
+        return self.catalog.bundle_names(linux_distro)
 
     def main(self):
         try:
@@ -481,17 +476,39 @@ class PackageManagerApp:
             self.clear_middle_section()
             self.print_menu(0, relevant_packages, self.selected_status_array)
             current_row = 0
+            catalog_generation = self.catalog.generation
 
             while True:
+                # Wake up now and then to notice a background catalog refresh.
+                self.stdscr.timeout(CATALOG_POLL_MS)
                 key = self.stdscr.getch()
+                self.stdscr.timeout(-1)
+
+                if key == -1 and self.catalog.generation == catalog_generation:
+                    continue
+
+                if self.catalog.generation != catalog_generation:
+                    # The catalog was refreshed in the background; keep the
+                    # selections of bundles that still exist.
+                    catalog_generation = self.catalog.generation
+                    selected_names = {
+                        name
+                        for idx, name in enumerate(relevant_packages)
+                        if self.selected_status_array[idx]
+                    }
+                    relevant_packages = self.packages(linux_distribution)
+                    self.selected_status_array = [
+                        name in selected_names for name in relevant_packages
+                    ]
+                    current_row = min(current_row, max(len(relevant_packages) - 1, 0))
 
-                if key == curses.KEY_DOWN:
+                if key == curses.KEY_DOWN and relevant_packages:
                     current_row = (current_row + 1) % len(relevant_packages)
 
-                elif key == curses.KEY_UP:
+                elif key == curses.KEY_UP and relevant_packages:
                     current_row = (current_row - 1) % len(relevant_packages)
 
-                elif key == 9:  # TAB key
+                elif key == 9 and relevant_packages:  # TAB key
                     self.selected_status_array[current_row] = (
                         not self.selected_status_array[current_row]
                     )
@@ -541,20 +558,24 @@ class PackageManagerApp:
                     if selection == "Yes":
                         curses.reset_shell_mode()
 
-                        for idx, entity in enumerate(selected_entities):
-                            self.stdscr.clear()
-                            action_message = f"{entity} {action}ing...\n"
-                            self.stdscr.addstr(
-                                1,
-                                0,
-                                action_message,
-                                color_pair | curses.A_BOLD | curses.A_UNDERLINE,
-                            )
-                            self.stdscr.refresh()
-                            get_linux_package_manager(
-                                linux_distribution, entity, output, action
-                            )
-                            curses.napms(1500)
+                        self.stdscr.clear()
+                        action_message = (
+                            f"{', '.join(selected_entities)} {action}ing...\n"
+                        )
+                        self.stdscr.addstr(
+                            1,
+                            0,
+                            action_message,
+                            color_pair | curses.A_BOLD | curses.A_UNDERLINE,
+                        )
+                        self.stdscr.refresh()
+                        get_linux_package_manager(
+                            linux_distribution,
+                            selected_entities,
+                            output,
+                            action,
+                            catalog=self.catalog,
+                        )
 
                         curses.reset_prog_mode()
                         self.stdscr.clear()
@@ -617,9 +638,9 @@ class PackageManagerApp:
 
 
 
-def start_terminal_ui():
+def start_terminal_ui(catalog=None):
     try:
-        curses.wrapper(lambda stdscr: PackageManagerApp(stdscr).main())
+        curses.wrapper(lambda stdscr: PackageManagerApp(stdscr, catalog).main())
     except KeyboardInterrupt:
         stdscr = curses.initscr()
         curses.start_color()
@@ -633,6 +654,6 @@ def start_terminal_ui():
         )
         stdscr.addstr(curses.LINES // 2, curses.COLS // 2 - 3, "Bye 👋")
         stdscr.refresh()
-        curses.napms(1500)
+        pause(1500)
         curses.endwin()
         sys.exit(0)